@@ -0,0 +1,237 @@
+"""
+Micro-benchmarks of the repository and auth hot paths at several contact book sizes.
+
+    python -m benchmarks.bench_hot_paths --contacts 1000 100000 1000000 --output results.json \
+        --baseline benchmarks/baseline.json
+
+Runs offline against a temporary SQLite file by default; pass --database postgresql+asyncpg://... to use
+a local Postgres (the contacts and users tables are dropped and recreated there). Each size is seeded once,
+every case is timed --repeat times after a warm-up, and the results are written as JSON. With --baseline the
+median of every case is compared with the stored run of the same database, size and case; a case slower
+than the baseline by more than --tolerance and --min-delta-ms fails the run with exit status 1.
+--save-baseline merges the results into the baseline file instead. The stored baseline is machine specific,
+refresh it on the machine that runs the comparison.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+
+import sqlalchemy
+from jose import jwt
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.services.auth import auth_service
+
+SEED_CHUNK = 10000
+PAGE = 20
+SLOW_REPEAT_DIVISOR = 20
+
+
+def contact_rows(count: int):
+    for i in range(count):
+        yield {'first_name': f'First{i}', 'last_name': f'Last{i % 1000}', 'email': f'contact{i}@example.com',
+               'phone': f'0{i:09d}', 'birthday': date(1950 + i % 50, 1 + i % 12, 1 + i % 28),
+               'other_info': None}
+
+
+async def seed(engine, count: int) -> User:
+    # only the benchmark's own tables: the other tables of a shared database are left alone
+    tables = [Contact.__table__, User.__table__]
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all, tables=tables)
+        await connection.run_sync(Base.metadata.create_all, tables=tables)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        user = User(username='bench', email='bench@example.com', confirmed=True,
+                    password=await auth_service.get_password_hash('secret'))
+        session.add(user)
+        await session.commit()
+        rows, chunk = contact_rows(count), []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == SEED_CHUNK:
+                await repository_contacts.import_contacts(chunk, user, session)
+                chunk = []
+        await repository_contacts.import_contacts(chunk, user, session)
+        await session.commit()
+    if engine.dialect.name == 'postgresql':
+        async with engine.connect() as connection:
+            await connection.execute(sqlalchemy.text('ANALYZE contacts'))
+    return user
+
+
+def cases(engine, user: User, count: int, password_hash: str) -> dict:
+    token = None
+
+    async def create_access_token():
+        nonlocal token
+        token = await auth_service.create_access_token({'sub': user.email})
+
+    async def jwt_decode():
+        jwt.decode(token, auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM])
+
+    async def decode_token_cached():
+        auth_service.decode_token(token)
+
+    async def verify_password():
+        await auth_service.verify_password('secret', password_hash)
+
+    def with_session(query):
+        async def run():
+            async with AsyncSession(engine) as session:
+                await query(session)
+        return run
+
+    middle = max(count // 2, 1)
+    return {
+        'auth.create_access_token': create_access_token,
+        'auth.jwt_decode': jwt_decode,
+        'auth.decode_token_cached': decode_token_cached,
+        'auth.verify_password': verify_password,
+        'contacts.get_contacts[offset=0]': with_session(
+            lambda db: repository_contacts.get_contacts(PAGE, 0, user, db)),
+        f'contacts.get_contacts[offset={middle}]': with_session(
+            lambda db: repository_contacts.get_contacts(PAGE, middle, user, db)),
+        f'contacts.get_contacts[after={middle}]': with_session(
+            lambda db: repository_contacts.get_contacts(PAGE, 0, user, db, after_id=middle)),
+        'contacts.search_contacts[prefix]': with_session(
+            lambda db: repository_contacts.search_contacts('First12', PAGE, 0, user, db)),
+        'contacts.search_contacts[email]': with_session(
+            lambda db: repository_contacts.search_contacts('contact77@example', PAGE, 0, user, db)),
+        'contacts.get_birthdays_one_week': with_session(
+            lambda db: repository_contacts.get_birthdays_one_week(user, db)),
+    }
+
+
+async def measure(func, repeat: int) -> dict:
+    await func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'min_ms': round(timings[0], 4),
+        'median_ms': round(statistics.median(timings), 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        'mean_ms': round(statistics.fmean(timings), 4),
+    }
+
+
+async def run(database: str | None, sizes: list[int], repeat: int) -> dict:
+    temporary = None
+    if database is None:
+        temporary = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        database = f'sqlite+aiosqlite:///{temporary.name}'
+    engine = create_async_engine(database, poolclass=NullPool)
+    results = []
+    try:
+        for count in sizes:
+            started = time.perf_counter()
+            user = await seed(engine, count)
+            print(f'seeded {count} contacts in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+            password_hash = await auth_service.get_password_hash('secret')
+            for name, func in cases(engine, user, count, password_hash).items():
+                slow = name == 'auth.verify_password'
+                stats = await measure(func, max(repeat // SLOW_REPEAT_DIVISOR, 3) if slow else repeat)
+                results.append({'name': name, 'contacts': count, **stats})
+                print(f"{count:>8} {name:<40} {stats['median_ms']:10.4f} ms", file=sys.stderr)
+    finally:
+        await engine.dispose()
+        if temporary is not None:
+            os.unlink(temporary.name)
+    return {
+        'meta': {
+            'database': engine.dialect.name,
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'machine': platform.machine(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list[str]:
+    """
+    The compare function matches the results with the baseline runs of the same database
+    and lists the cases whose median grew by more than the tolerance and by at least min_delta_ms,
+    so the jitter of sub-millisecond cases is not reported.
+
+    :param report: dict: The results of this run
+    :param baseline: dict: The stored baseline, {database: [results]}
+    :param tolerance: float: Allowed relative slowdown, 0.2 is 20%
+    :param min_delta_ms: float: Smallest absolute slowdown that counts
+    :return: A list of regression descriptions
+    """
+    stored = {(result['name'], result['contacts']): result
+              for result in baseline.get(report['meta']['database'], [])}
+    regressions = []
+    for result in report['results']:
+        reference = stored.get((result['name'], result['contacts']))
+        if reference is None:
+            continue
+        ratio = result['median_ms'] / reference['median_ms'] if reference['median_ms'] else 1.0
+        result['baseline_median_ms'], result['ratio'] = reference['median_ms'], round(ratio, 3)
+        if ratio > 1 + tolerance and result['median_ms'] - reference['median_ms'] >= min_delta_ms:
+            regressions.append(f"{result['contacts']:>8} {result['name']}: {reference['median_ms']} ms -> "
+                               f"{result['median_ms']} ms (x{ratio:.2f})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='async database URL, a temporary SQLite file by default')
+    parser.add_argument('--contacts', type=int, nargs='+', default=[1000, 100000, 1000000], help='book sizes')
+    parser.add_argument('--repeat', type=int, default=100, help='timed runs per case')
+    parser.add_argument('--output', help='write the results as JSON to this file (stdout by default)')
+    parser.add_argument('--baseline', help='baseline JSON file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown against the baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='ignore smaller absolute slowdowns')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results in the baseline file')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.database, args.contacts, args.repeat))
+    regressions = []
+    if args.baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        if args.save_baseline:
+            database = report['meta']['database']
+            kept = [result for result in baseline.get(database, [])
+                    if (result['name'], result['contacts']) not in
+                    {(new['name'], new['contacts']) for new in report['results']}]
+            baseline[database] = kept + [{key: result[key] for key in ('name', 'contacts', 'median_ms', 'p95_ms')}
+                                         for result in report['results']]
+            with open(args.baseline, 'w') as file:
+                json.dump(baseline, file, indent=2)
+                file.write('\n')
+        else:
+            regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Per-row cost of rendering a page of contacts, before and after the fast serialization path.
+
+    python -m benchmarks.bench_serialization --rows 100 --repeat 200
+
+orm:  ORM Contact objects validated through ContactResponse (orm_mode), jsonable_encoder and JSONResponse,
+      the way FastAPI renders a response_model.
+core: Core rows of CONTACT_RESPONSE_COLUMNS rendered once with orjson.
+Both are timed with and without the query (an in-memory SQLite database).
+"""
+import argparse
+import asyncio
+import time
+from datetime import date
+from typing import List
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import CONTACT_RESPONSE_COLUMNS
+from src.schemas import ContactResponse
+
+RESPONSE_FIELD = create_response_field(name='response', type_=List[ContactResponse])
+
+
+def setup(rows: int) -> Session:
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    user = User(username='bench', email='bench@example.com', password='secret')
+    session.add(user)
+    session.flush()
+    session.add_all(Contact(first_name=f'First{i}', last_name=f'Last{i}', email=f'contact{i}@example.com',
+                            phone='0661234567', birthday=date(1990, 1, 1 + i % 28), other_info='note',
+                            user_id=user.id) for i in range(rows))
+    session.commit()
+    return session
+
+
+def fetch_orm(session: Session) -> list:
+    session.expunge_all()
+    return session.scalars(select(Contact).order_by(Contact.id)).all()
+
+
+def fetch_core(session: Session) -> list:
+    return session.execute(select(*CONTACT_RESPONSE_COLUMNS).order_by(Contact.id)).all()
+
+
+async def render_orm(contacts: list) -> bytes:
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=contacts, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def render_core(contacts: list) -> bytes:
+    return orjson.dumps([contact._asdict() for contact in contacts])
+
+
+async def measure(repeat: int, func, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await func(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+async def main(rows: int, repeat: int) -> None:
+    session = setup(rows)
+    orm_rows, core_rows = fetch_orm(session), fetch_core(session)
+    assert orjson.loads(await render_orm(orm_rows)) == orjson.loads(await render_core(core_rows))
+
+    async def fetch_and_render(fetch, render):
+        return await render(fetch(session))
+
+    results = {
+        'orm render': await measure(repeat, render_orm, orm_rows),
+        'core render': await measure(repeat, render_core, core_rows),
+        'orm fetch+render': await measure(repeat, fetch_and_render, fetch_orm, render_orm),
+        'core fetch+render': await measure(repeat, fetch_and_render, fetch_core, render_core),
+    }
+    for name, seconds in results.items():
+        print(f'{name:<18} {seconds * 1e6 / rows:8.2f} us/row {seconds * 1e3:8.3f} ms/page')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100, help='contacts per page')
+    parser.add_argument('--repeat', type=int, default=200, help='pages rendered per measurement')
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -1,18 +1,30 @@
+import os
 import time
 
 import redis.asyncio as redis
 
 from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db_connect import get_db
+from src.conf.config import settings
+from src.database.db_connect import engine, get_db, get_pool_stats, warm_up_pool
 from src.routes import contacts, auth, users
+from src.services import metrics
+from src.services.avatar_jobs import avatar_jobs
+from src.services.email_outbox import email_outbox
+from src.services.password_pool import password_pool
+from src.services.rate_limit import RateLimiter, rate_limits
+from src.services.refresh_sessions import refresh_sessions
+from src.services.response_cache import response_cache
+from src.services.slow_query import slow_query_log
+from src.services.user_cache import user_cache
 
 app = FastAPI()
+metrics.instrument_engine(engine)
+slow_query_log.instrument(engine)
 
 
 @app.on_event("startup")
@@ -21,12 +33,46 @@ async def startup():
     The startup function is called when the application starts up.
     It's a good place to initialize things that are needed by your app,
     like connecting to databases or initializing external APIs.
+    One Redis client, kept in app.state.redis, is shared by the rate limiter, the caches
+    and the refresh sessions.
 
-    :return: The FastAPILimiter object
+    :return: None
     :doc-author: Trelent
     """
-    r = await redis.Redis(host='localhost', port=6379, db=0, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(r)
+    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
+                    decode_responses=True)
+    app.state.redis = r
+    rate_limits.start(r)
+    await user_cache.start(r)
+    response_cache.start(r)
+    avatar_jobs.start(r)
+    refresh_sessions.start(r)
+    slow_query_log.start()
+    await warm_up_pool()
+    if settings.mail_outbox_worker:
+        email_outbox.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    The shutdown function is called when the application shuts down.
+    It stops the email outbox worker, detaches the rate limiter, the caches, the avatar job status
+    and the refresh sessions from Redis and closes the Redis client, releases the worker threads of the password
+    hashing pool, retires the metrics of this worker process and flushes the slow query log.
+
+    :return: None
+    """
+    await email_outbox.stop()
+    await user_cache.stop()
+    response_cache.stop()
+    avatar_jobs.stop()
+    refresh_sessions.stop()
+    rate_limits.stop()
+    await app.state.redis.aclose()
+    password_pool.shutdown()
+    metrics.mark_process_dead()
+    slow_query_log.stop()
 
 
 app.add_middleware(
@@ -35,6 +81,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Link", "ETag"],
 )
 
 
@@ -49,13 +96,26 @@ async def custom_middleware(request: Request, call_next):
     :return: A middleware function
     :doc-author: Trelent
     """
-    start_time = time.time()
+    start_time = time.perf_counter()
     response = await call_next(request)
-    during = time.time() - start_time
+    during = time.perf_counter() - start_time
     response.headers['performance'] = str(during)
     return response
 
 
+app.middleware('http')(metrics.metrics_middleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """
+    The read_metrics function exposes the application metrics in the Prometheus text format.
+
+    :return: The metrics of all worker processes
+    """
+    return metrics.metrics_response()
+
+
 @app.get("/", dependencies=[Depends(RateLimiter(times=2, seconds=5))])
 async def root():
     """
@@ -69,22 +129,23 @@ async def root():
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
     The healthchecker function is a simple function that checks the health of the database.
     It does this by making a request to the database and checking if it returns any results.
     If there are no results, then we know something is wrong with our connection.
+    The response also carries the connection pool statistics.
 
-    :param db: Session: Get the database connection from the dependency
+    :param db: AsyncSession: Get the database connection from the dependency
     :return: A dictionary with a message
     :doc-author: Trelent
     """
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         if result is None:
             raise HTTPException(status_code=500, detail="Database is not configured correctly")
-        return {"message": "Welcome to FastAPI!"}
+        return {"message": "Welcome to FastAPI!", "pool": get_pool_stats()}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error connecting to the database")
@@ -93,3 +154,7 @@ def healthchecker(db: Session = Depends(get_db)):
 app.include_router(contacts.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
+
+if settings.avatar_storage == 'local':
+    os.makedirs(settings.storage_local_root, exist_ok=True)
+    app.mount(settings.storage_local_url, StaticFiles(directory=settings.storage_local_root), name='media')
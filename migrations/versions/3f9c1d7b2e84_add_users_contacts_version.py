@@ -0,0 +1,24 @@
+"""add users contacts_version
+
+Revision ID: 3f9c1d7b2e84
+Revises: 7c4e2b9d1a65
+Create Date: 2026-10-17 00:21:46.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c1d7b2e84'
+down_revision = '7c4e2b9d1a65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('contacts_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'contacts_version')
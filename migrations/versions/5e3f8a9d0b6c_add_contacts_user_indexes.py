@@ -0,0 +1,32 @@
+"""add contacts per-user composite indexes
+
+Revision ID: 5e3f8a9d0b6c
+Revises: d2a7c5e81f90
+Create Date: 2026-10-16 23:58:03.214770
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e3f8a9d0b6c'
+down_revision = 'd2a7c5e81f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_last_name', 'contacts', ['user_id', 'last_name'], unique=False)
+    op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at'], unique=False)
+    op.create_index('ix_contacts_user_id_birthday_day_of_year', 'contacts', ['user_id', 'birthday_day_of_year'],
+                    unique=False)
+    op.drop_index('ix_contacts_birthday_day_of_year', table_name='contacts')
+
+
+def downgrade() -> None:
+    op.create_index('ix_contacts_birthday_day_of_year', 'contacts', ['birthday_day_of_year'], unique=False)
+    op.drop_index('ix_contacts_user_id_birthday_day_of_year', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_updated_at', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_last_name', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,39 @@
+"""add email outbox
+
+Revision ID: 7c4e2b9d1a65
+Revises: 5e3f8a9d0b6c
+Create Date: 2026-10-16 23:58:12.417305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4e2b9d1a65'
+down_revision = '5e3f8a9d0b6c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('email_outbox',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('recipient', sa.String(length=250), nullable=False),
+                    sa.Column('subject', sa.String(length=255), nullable=False),
+                    sa.Column('body', sa.Text(), nullable=False),
+                    sa.Column('status', sa.String(length=16), nullable=False),
+                    sa.Column('attempts', sa.Integer(), nullable=False),
+                    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+                    sa.Column('last_error', sa.String(length=1000), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.Column('sent_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_email_outbox_status_next_attempt_at', 'email_outbox', ['status', 'next_attempt_at'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_outbox_status_next_attempt_at', table_name='email_outbox')
+    op.drop_table('email_outbox')
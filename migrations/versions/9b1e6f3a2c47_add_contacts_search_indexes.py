@@ -0,0 +1,37 @@
+"""add contacts search indexes
+
+Revision ID: 9b1e6f3a2c47
+Revises: 4c3fa01b4d87
+Create Date: 2026-10-16 23:05:12.418256
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1e6f3a2c47'
+down_revision = '4c3fa01b4d87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_contacts_search_document', 'contacts',
+                    [sa.text("to_tsvector('simple'::regconfig, coalesce(first_name, '') || ' ' || "
+                             "coalesce(last_name, '') || ' ' || coalesce(email, ''))")],
+                    unique=False, postgresql_using='gin')
+    op.create_index('ix_contacts_first_name_trgm', 'contacts', ['first_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'first_name': 'gin_trgm_ops'})
+    op.create_index('ix_contacts_last_name_trgm', 'contacts', ['last_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'last_name': 'gin_trgm_ops'})
+    op.create_index('ix_contacts_email_trgm', 'contacts', ['email'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_email_trgm', table_name='contacts')
+    op.drop_index('ix_contacts_last_name_trgm', table_name='contacts')
+    op.drop_index('ix_contacts_first_name_trgm', table_name='contacts')
+    op.drop_index('ix_contacts_search_document', table_name='contacts')
@@ -0,0 +1,30 @@
+"""add contacts birthday_day_of_year
+
+Revision ID: d2a7c5e81f90
+Revises: 9b1e6f3a2c47
+Create Date: 2026-10-16 23:31:47.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e81f90'
+down_revision = '9b1e6f3a2c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_day_of_year', sa.Integer(), nullable=True))
+    # day of year counted in a leap year (2000), matching src.database.models.birthday_day_of_year
+    op.execute("UPDATE contacts SET birthday_day_of_year = "
+               "EXTRACT(DOY FROM make_date(2000, EXTRACT(MONTH FROM birthday)::int, EXTRACT(DAY FROM birthday)::int)) "
+               "WHERE birthday IS NOT NULL")
+    op.create_index(op.f('ix_contacts_birthday_day_of_year'), 'contacts', ['birthday_day_of_year'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_contacts_birthday_day_of_year'), table_name='contacts')
+    op.drop_column('contacts', 'birthday_day_of_year')
@@ -1,24 +1,187 @@
+import asyncio
+import functools
+import logging
+
 from fastapi import HTTPException, status
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
 
 from src.conf.config import settings
+from src.database.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, pool_stats
 
+logger = logging.getLogger(__name__)
 
 URI = settings.sqlalchemy_database_url
 
-engine = create_engine(URI, echo=True)
-DBSession = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def get_async_url(uri: str | URL) -> URL:
+    """
+    The get_async_url function maps a sync database URL (e.g. postgresql+psycopg2) onto
+    the asyncio driver of the same backend (asyncpg for Postgres, aiosqlite for SQLite).
+
+    :param uri: str | URL: The sync database URL from the settings
+    :return: The database URL with the async driver
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}'")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def get_connect_args(url: URL) -> dict:
+    """
+    The get_connect_args function returns driver specific connect arguments.
+    For asyncpg it turns on the prepared statement cache, so repeated repository
+    queries skip the parse/plan step on the server.
+
+    :param url: URL: The async database URL
+    :return: A dictionary of connect arguments
+    """
+    if url.get_driver_name() == 'asyncpg':
+        return {'prepared_statement_cache_size': settings.sqlalchemy_statement_cache_size}
+    return {}
+
+
+def get_pool_args(url: URL) -> dict:
+    """
+    The get_pool_args function returns the engine arguments of the connection pool, taken from the settings.
+    Server databases get an instrumented QueuePool that records checkout waits in pool_stats;
+    SQLite keeps the pool SQLAlchemy picks for it.
+
+    :param url: URL: The database URL
+    :return: A dictionary of create_engine arguments
+    """
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    poolclass = InstrumentedAsyncQueuePool if url.get_driver_name() in ASYNC_DRIVERS.values() else InstrumentedQueuePool
+    return {
+        'poolclass': poolclass,
+        'pool_size': settings.sqlalchemy_pool_size,
+        'max_overflow': settings.sqlalchemy_max_overflow,
+        'pool_timeout': settings.sqlalchemy_pool_timeout,
+        'pool_recycle': settings.sqlalchemy_pool_recycle,
+        'pool_pre_ping': settings.sqlalchemy_pool_pre_ping,
+    }
+
+
+class SyncSessionAdapter:
+    """
+    Rollback path for ``sqlalchemy_async = False``: wraps a sync ``Session`` and exposes the
+    awaitable subset of the ``AsyncSession`` API the repositories use. Blocking calls run in
+    the threadpool so they do not stall the event loop.
+    """
+    _blocking = frozenset({'execute', 'scalar', 'scalars', 'get', 'delete', 'merge',
+                           'commit', 'rollback', 'refresh', 'flush', 'close'})
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync_session, name)
+        if name in self._blocking:
+            return functools.partial(run_in_threadpool, attr)
+        return attr
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def stream(self, statement, *args, **kwargs):
+        statement = statement.execution_options(stream_results=True)
+        return SyncStreamAdapter(await run_in_threadpool(self.sync_session.execute, statement, *args, **kwargs))
+
+
+class SyncStreamAdapter:
+    """
+    Counterpart of ``AsyncResult`` for SyncSessionAdapter.stream: fetches the server-side
+    cursor in the threadpool, one partition at a time.
+    """
+
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size: int | None = None):
+        size = size or self.result.context.execution_options.get('yield_per', 1000)
+        while partition := await run_in_threadpool(self.result.fetchmany, size):
+            yield partition
+
+
+if settings.sqlalchemy_async:
+    ASYNC_URI = get_async_url(URI)
+    engine = create_async_engine(ASYNC_URI, echo=settings.sqlalchemy_echo, connect_args=get_connect_args(ASYNC_URI),
+                                 **get_pool_args(ASYNC_URI))
+    DBSession = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+else:
+    engine = create_engine(URI, echo=settings.sqlalchemy_echo, **get_pool_args(make_url(URI)))
+    DBSession = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+
+
+def _warm_up_sync(size: int) -> None:
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def warm_up_pool() -> None:
+    """
+    The warm_up_pool function opens pool_size connections at startup and returns them to the pool,
+    so the first requests do not pay for connecting. A database that is down is logged, not raised.
+
+    :return: None
+    """
+    size = settings.sqlalchemy_pool_size
+    try:
+        if not settings.sqlalchemy_async:
+            await run_in_threadpool(_warm_up_sync, size)
+            return
+        connections = await asyncio.gather(*(engine.connect().start() for _ in range(size)), return_exceptions=True)
+        for connection in connections:
+            if not isinstance(connection, BaseException):
+                await connection.close()
+        errors = [connection for connection in connections if isinstance(connection, BaseException)]
+        if errors:
+            raise errors[0]
+    except (SQLAlchemyError, OSError) as err:
+        logger.warning("connection pool warm-up failed: %s", err)
+
+
+def get_pool_stats() -> dict:
+    """
+    The get_pool_stats function returns the checkout counters and the current state of the connection pool.
+
+    :return: A dictionary of pool statistics
+    """
+    pool = engine.sync_engine.pool if settings.sqlalchemy_async else engine.pool
+    return pool_stats.snapshot(pool)
+
+
+def get_session():
+    """
+    The get_session function opens a session outside of a request, for background workers and tasks.
+    The caller closes it.
+
+    :return: A new session (an AsyncSession or a SyncSessionAdapter)
+    """
+    return DBSession() if settings.sqlalchemy_async else SyncSessionAdapter(DBSession())
 
 
 # Dependency
-def get_db():
-    db = DBSession()
+async def get_db():
+    db = get_session()
     try:
         yield db
     except SQLAlchemyError as err:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
     finally:
-        db.close()
+        await db.close()
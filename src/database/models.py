@@ -1,8 +1,35 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, func, ForeignKey, Boolean
-from sqlalchemy.orm import declarative_base, relationship
+from datetime import date
+
+from sqlalchemy import (Column, Integer, String, Text, Date, DateTime, func, ForeignKey, Boolean, Index, DDL,
+                        event, text)
+from sqlalchemy.orm import declarative_base, relationship, validates
 
 Base = declarative_base()
 
+# Full text document of a contact. Postgres indexes this exact expression (GIN),
+# so the search query has to use it verbatim for the planner to pick the index.
+CONTACT_SEARCH_DOCUMENT = ("to_tsvector('simple'::regconfig, coalesce(first_name, '') || ' ' || "
+                           "coalesce(last_name, '') || ' ' || coalesce(email, ''))")
+
+
+def birthday_day_of_year(birthday: date | str | None) -> int | None:
+    """
+    The birthday_day_of_year function returns the day of year of a birthday counted in a leap year,
+    so 29 February is always 60 and 1 March always 61 whatever the current year is.
+
+    :param birthday: date | str | None: The birthday, a date or an ISO string
+    :return: The day of year, 1..366, or None without a birthday
+    """
+    if birthday is None:
+        return None
+    if isinstance(birthday, str):
+        birthday = date.fromisoformat(birthday)
+    return date(2000, birthday.month, birthday.day).timetuple().tm_yday
+
+
+def _default_birthday_day_of_year(context):
+    return birthday_day_of_year(context.get_current_parameters().get('birthday'))
+
 
 class Contact(Base):
     __tablename__ = "contacts"
@@ -12,12 +39,35 @@ class Contact(Base):
     email = Column(String)
     phone = Column(String)
     birthday = Column(Date)
+    # maintained from birthday (ORM assignment or Core insert default), see birthday_day_of_year
+    birthday_day_of_year = Column(Integer, default=_default_birthday_day_of_year)
     other_info = Column(String, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    @validates('birthday')
+    def validate_birthday(self, key, birthday):
+        self.birthday_day_of_year = birthday_day_of_year(birthday)
+        return birthday
+
+    # every query is scoped to one user's book, so the indexes lead with user_id
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_last_name', 'user_id', 'last_name'),
+        Index('ix_contacts_user_id_updated_at', 'user_id', 'updated_at'),
+        Index('ix_contacts_user_id_birthday_day_of_year', 'user_id', 'birthday_day_of_year'),
+        Index('ix_contacts_search_document', text(CONTACT_SEARCH_DOCUMENT),
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+        Index('ix_contacts_first_name_trgm', 'first_name', postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_last_name_trgm', 'last_name', postgresql_using='gin',
+              postgresql_ops={'last_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_email_trgm', 'email', postgresql_using='gin',
+              postgresql_ops={'email': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -28,3 +78,51 @@ class User(Base):
     refresh_token = Column(String(255), nullable=True)
     avatar = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
+    # incremented in the transaction of every write to the user's contacts, versions the contact list
+    contacts_version = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+class EmailOutbox(Base):
+    """
+    A message waiting to be sent by the outbox worker (src.services.email_outbox).
+    next_attempt_at is both the retry time and the lease of the worker that claimed the row.
+    """
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String(250), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=func.now())
+    last_error = Column(String(1000), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+event.listen(Base.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+# SQLite (tests, offline runs) has no trigram/tsvector support: keep an external-content
+# FTS5 index of the searchable columns in sync with triggers instead.
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "first_name, last_name, email, content='contacts', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email); "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email); END",
+):
+    event.listen(Contact.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Contact.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS contacts_fts').execute_if(dialect='sqlite'))
@@ -0,0 +1,173 @@
+"""
+Fills a database with deterministic fake users and contacts for scale testing.
+
+    python -m src.database.seed --users 1000 --contacts 1000000 --seed 42
+
+The same --seed always produces the same data. Users share one password (--password), hashed once;
+contacts are spread over the users with a heavy tail, so a few users have large books, and get
+popular first and last names, a realistic age and birthday spread and e-mails on common domains.
+Rows are inserted in chunks through COPY on asyncpg and multi-row INSERTs elsewhere, one commit per chunk.
+The target database is expected to be empty of seeded users, their e-mails are unique.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Iterator
+
+from libgravatar import Gravatar
+from passlib.context import CryptContext
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.conf.config import settings
+from src.database.db_connect import get_async_url, get_connect_args
+from src.database.models import Base, User
+from src.repository.contacts import bulk_insert_contacts
+
+FIRST_NAMES = ('James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+               'Olena', 'Andriy', 'Iryna', 'Oleksandr', 'Natalia', 'Dmytro', 'Tetiana', 'Serhii', 'Yulia', 'Maksym',
+               'Anna', 'Ivan', 'Kateryna', 'Mykola', 'Svitlana', 'Taras', 'Oksana', 'Bohdan', 'Halyna', 'Yaroslav')
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Wilson', 'Anderson', 'Taylor', 'Thomas', 'Moore', 'Jackson', 'Martin', 'Lee', 'Thompson', 'White',
+              'Melnyk', 'Shevchenko', 'Boyko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kovalchuk', 'Kravchenko',
+              'Oliynyk', 'Shevchuk', 'Koval', 'Polishchuk', 'Bondar', 'Tkachuk', 'Moroz', 'Marchenko', 'Lysenko',
+              'Rudenko', 'Savchenko', 'Petrenko')
+DOMAINS = ('gmail.com', 'ukr.net', 'outlook.com', 'yahoo.com', 'meta.ua', 'i.ua', 'icloud.com', 'example.com')
+# birthdays are drawn relative to a fixed day, so the data does not depend on when it is generated
+REFERENCE_DATE = date(2024, 1, 1)
+NOTES = ('Met at the conference', 'Colleague', 'Neighbour', 'School friend', 'Call after 6 pm', 'Family')
+
+
+def zipf_cum_weights(size: int, exponent: float = 1.0) -> list[float]:
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, size + 1)))
+
+
+FIRST_NAME_WEIGHTS = zipf_cum_weights(len(FIRST_NAMES))
+LAST_NAME_WEIGHTS = zipf_cum_weights(len(LAST_NAMES))
+DOMAIN_WEIGHTS = zipf_cum_weights(len(DOMAINS), 1.5)
+
+
+def split_contacts(rng: random.Random, total: int, users: int) -> list[int]:
+    """
+    The split_contacts function spreads total contacts over users with Pareto distributed weights,
+    so most books are small and a few are very large.
+
+    :param rng: random.Random: The seeded generator
+    :param total: int: Number of contacts
+    :param users: int: Number of users
+    :return: The number of contacts of every user, summing to total
+    """
+    if not users:
+        return []
+    weights = [rng.paretovariate(1.5) for _ in range(users)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for index in rng.sample(range(users), total - sum(counts)):
+        counts[index] += 1
+    return counts
+
+
+def fake_birthday(rng: random.Random) -> date:
+    age = min(max(rng.gauss(38, 15), 16), 95)
+    return REFERENCE_DATE - timedelta(days=int(age * 365.25) + rng.randrange(365))
+
+
+def fake_contacts(rng: random.Random, user_number: int, user_id: int, count: int) -> Iterator[dict]:
+    for number in range(count):
+        first_name = rng.choices(FIRST_NAMES, cum_weights=FIRST_NAME_WEIGHTS)[0]
+        last_name = rng.choices(LAST_NAMES, cum_weights=LAST_NAME_WEIGHTS)[0]
+        domain = rng.choices(DOMAINS, cum_weights=DOMAIN_WEIGHTS)[0]
+        yield {
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': f'{first_name}.{last_name}.{user_number}.{number}@{domain}'.lower(),
+            'phone': f'+380{rng.choice((50, 63, 66, 67, 68, 73, 93, 95, 96, 97, 98, 99))}{rng.randrange(10 ** 7):07d}',
+            'birthday': fake_birthday(rng),
+            'other_info': rng.choice(NOTES) if rng.random() < 0.2 else None,
+            'user_id': user_id,
+        }
+
+
+def fake_users(start: int, count: int, password_hash: str) -> list[dict]:
+    users = []
+    for number in range(start, start + count):
+        email = f'seed{number:07d}@example.com'
+        users.append({'username': f'seed{number:07d}', 'email': email, 'password': password_hash,
+                      'avatar': Gravatar(email).get_image(), 'confirmed': True})
+    return users
+
+
+async def seed(db: AsyncSession, users: int, contacts: int, seed_value: int = 0, password: str = 'password',
+               chunk_size: int = 10000, start: int = 0, log=None) -> tuple[int, int]:
+    """
+    The seed function inserts the fake users and contacts.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param users: int: Number of users
+    :param contacts: int: Number of contacts in total
+    :param seed_value: int: Seed of the generator, the same seed gives the same data
+    :param password: str: Password of every user, hashed once
+    :param chunk_size: int: Rows per INSERT/COPY and per commit
+    :param start: int: Number of the first user, to add users to an already seeded database
+    :param log: Stream for progress messages
+    :return: The number of users and contacts inserted
+    """
+    rng = random.Random(seed_value)
+    password_hash = CryptContext(schemes=['bcrypt'], deprecated='auto').hash(password)
+    user_ids = []
+    for offset in range(0, users, chunk_size):
+        rows = fake_users(start + offset, min(chunk_size, users - offset), password_hash)
+        result = await db.execute(insert(User).returning(User.id, User.email), rows)
+        ids = {email: user_id for user_id, email in result}
+        user_ids.extend(ids[row['email']] for row in rows)
+        await db.commit()
+
+    inserted, started, chunk = 0, time.perf_counter(), []
+    for number, (user_id, count) in enumerate(zip(user_ids, split_contacts(rng, contacts, users)), start):
+        for row in fake_contacts(rng, number, user_id, count):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                await bulk_insert_contacts(chunk, db)
+                await db.commit()
+                inserted += len(chunk)
+                chunk = []
+                if log is not None:
+                    print(f'{inserted} contacts, {inserted / (time.perf_counter() - started):.0f}/s', file=log)
+    await bulk_insert_contacts(chunk, db)
+    await db.commit()
+    return len(user_ids), inserted + len(chunk)
+
+
+async def main(args: argparse.Namespace) -> None:
+    url = get_async_url(args.database or settings.sqlalchemy_database_url)
+    engine = create_async_engine(url, connect_args=get_connect_args(url))
+    try:
+        if args.create_schema:
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            started = time.perf_counter()
+            users, contacts = await seed(db, args.users, args.contacts, args.seed, args.password, args.chunk_size,
+                                         args.start, log=sys.stderr)
+        print(f'seeded {users} users and {contacts} contacts in {time.perf_counter() - started:.1f}s',
+              file=sys.stderr)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='database URL, SQLALCHEMY_DATABASE_URL by default')
+    parser.add_argument('--users', type=int, default=1000, help='number of users')
+    parser.add_argument('--contacts', type=int, default=100000, help='number of contacts in total')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generator')
+    parser.add_argument('--password', default='password', help='password of every seeded user')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='rows per insert and commit')
+    parser.add_argument('--start', type=int, default=0, help='number of the first seeded user')
+    parser.add_argument('--create-schema', action='store_true', help='create missing tables first')
+    asyncio.run(main(parser.parse_args()))
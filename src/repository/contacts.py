@@ -1,66 +1,291 @@
-from datetime import date, timedelta
+import asyncio
+import re
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Sequence
 
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import extract
+from sqlalchemy import select, insert, update, delete, func, literal_column, table, column, case, Row
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Contact
-from src.schemas import ContactResponse, BirthdayResponse
+from src.database.models import Contact, User, CONTACT_SEARCH_DOCUMENT, birthday_day_of_year
+from src.services.response_cache import response_cache
+from src.schemas import ContactResponse, ContactOperation, ContactOperationType, \
+    ContactOperationResult
 
 
-async def create_contact(body: ContactResponse, db: Session):
+CONTACT_COLUMNS = (Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone,
+                   Contact.birthday, Contact.other_info)
+# the timestamps are truncated by the database, rows come out exactly as ContactResponse renders them
+CONTACT_RESPONSE_COLUMNS = CONTACT_COLUMNS + (func.date(Contact.created_at).label('created_at'),
+                                              func.date(Contact.updated_at).label('updated_at'))
+EXPORT_COLUMNS = CONTACT_COLUMNS + (Contact.created_at, Contact.updated_at)
+BIRTHDAY_COLUMNS = (Contact.id, Contact.first_name, Contact.last_name, Contact.birthday)
+
+
+async def create_contact(body: ContactResponse, user: User, db: AsyncSession):
     """
     The create_contact function creates a new contact in the database.
     Args:
         body (ContactResponse): The contact to be created.
+        user (User): The owner of the contact.
 
     :param body: ContactResponse: Create a new contact object
-    :param db: Session: Pass the database session to the function
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass the database session to the function
     :return: The contact that was created
     :doc-author: Trelent
     """
 
-    contact = Contact(**body.dict())
+    contact = Contact(**body.dict(), user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await bump_contacts_version(user, db)
+    await db.commit()
+    await db.refresh(contact)
+    await response_cache.bump(user.id)
     return contact
 
 
-async def get_contacts(limit: int, offset: int, db: Session):
+CONTACT_COPY_COLUMNS = ('first_name', 'last_name', 'email', 'phone', 'birthday', 'birthday_day_of_year',
+                        'other_info', 'created_at', 'updated_at', 'user_id')
+
+
+async def copy_contacts(rows: list[dict], db: AsyncSession) -> None:
+    """
+    The copy_contacts function inserts contact rows with Postgres COPY through the asyncpg driver connection.
+    COPY skips the SQLAlchemy column defaults, so every column in CONTACT_COPY_COLUMNS is filled in here.
+
+    :param rows: list[dict]: Contact column values, each with a user_id
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    now = datetime.utcnow()
+    records = [
+        (row['first_name'], row['last_name'], row['email'], row['phone'], row['birthday'],
+         birthday_day_of_year(row['birthday']), row.get('other_info'), now, now, row['user_id'])
+        for row in rows
+    ]
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        Contact.__tablename__, records=records, columns=CONTACT_COPY_COLUMNS
+    )
+
+
+async def bulk_insert_contacts(rows: list[dict], db: AsyncSession) -> None:
+    """
+    The bulk_insert_contacts function inserts contact rows that already carry their user_id.
+    On asyncpg the rows go through COPY, elsewhere through one multi-row executemany INSERT.
+    The caller commits.
+
+    :param rows: list[dict]: Contact fields with a user_id
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    if not rows:
+        return
+    if db.get_bind().dialect.driver == 'asyncpg':
+        await copy_contacts(rows, db)
+    else:
+        await db.execute(insert(Contact), rows)
+
+
+async def import_contacts(rows: list[dict], user: User, db: AsyncSession) -> None:
+    """
+    The import_contacts function bulk inserts already validated contacts for the user.
+    The caller commits, so a whole import runs in one transaction.
+
+    :param rows: list[dict]: Contact fields as produced by ContactModel.dict()
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    await bulk_insert_contacts([{**row, 'user_id': user.id} for row in rows], db)
+
+
+async def batch_contacts(operations: list[ContactOperation], user: User,
+                         db: AsyncSession) -> list[ContactOperationResult]:
+    """
+    The batch_contacts function applies a list of create, update and delete operations to the user's contacts
+    in a single transaction. The ids are checked with one SELECT, then every kind of operation runs as one
+    bulk statement: a multi-row INSERT ... RETURNING, an executemany UPDATE by primary key and a DELETE ... IN.
+    An operation on a missing contact, or a second operation on the same contact, is reported and skipped.
+
+    :param operations: list[ContactOperation]: The operations, in request order
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: One ContactOperationResult per operation, in request order
+    """
+    ids = {operation.id for operation in operations if operation.op != ContactOperationType.create}
+    existing = set()
+    if ids:
+        existing = set(await db.scalars(select(Contact.id).filter(Contact.user_id == user.id, Contact.id.in_(ids))))
+
+    results, creates, updates, deletes, seen = [], [], [], [], set()
+    for index, operation in enumerate(operations):
+        result = ContactOperationResult(index=index, op=operation.op, id=operation.id, status=200)
+        results.append(result)
+        if operation.op == ContactOperationType.create:
+            result.status = 201
+            creates.append((result, {**operation.contact.dict(), 'user_id': user.id}))
+        elif operation.id not in existing:
+            result.status, result.detail = 404, 'Not Found'
+        elif operation.id in seen:
+            result.status, result.detail = 409, 'Contact already changed in this batch'
+        elif operation.op == ContactOperationType.update:
+            seen.add(operation.id)
+            values = operation.contact.dict()
+            updates.append({**values, 'id': operation.id,
+                            'birthday_day_of_year': birthday_day_of_year(values['birthday'])})
+        else:
+            seen.add(operation.id)
+            result.status = 204
+            deletes.append(operation.id)
+
+    if creates:
+        stmt = insert(Contact).returning(Contact.id, sort_by_parameter_order=True)
+        new_ids = await db.scalars(stmt, [values for _, values in creates])
+        for (result, _), new_id in zip(creates, new_ids.all()):
+            result.id = new_id
+    if updates:
+        await db.execute(update(Contact), updates)
+    if deletes:
+        await db.execute(delete(Contact).filter(Contact.user_id == user.id, Contact.id.in_(deletes)))
+    if creates or updates or deletes:
+        await bump_contacts_version(user, db)
+    await db.commit()
+    await response_cache.bump(user.id)
+    return results
+
+
+def _export_query(user: User):
+    return select(*EXPORT_COLUMNS).filter_by(user_id=user.id).order_by(Contact.id)
+
+
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[Sequence[Row]]:
+    """
+    The stream_contacts function yields all contacts of the user, as rows of EXPORT_COLUMNS,
+    in partitions read from a server-side cursor, so memory stays flat whatever the size of the book.
+
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: Number of rows fetched per round trip
+    :return: An async iterator of row partitions
     """
-    The get_contacts function returns a list of contacts from the database.
+    result = await db.stream(_export_query(user).execution_options(yield_per=batch_size))
+    async for partition in result.partitions():
+        yield partition
+
+
+async def copy_contacts_csv(user: User, db: AsyncSession) -> AsyncIterator[bytes]:
+    """
+    The copy_contacts_csv function streams the user's contacts as CSV produced by Postgres itself
+    with COPY ... TO STDOUT (asyncpg only). The chunks go through a small bounded queue,
+    so a slow client pauses the COPY instead of buffering it.
+
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: An async iterator of CSV chunks, header row included
+    """
+    connection = await db.connection()
+    raw_connection = (await connection.get_raw_connection()).driver_connection
+    query = str(_export_query(user).compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    queue = asyncio.Queue(maxsize=16)
+
+    async def produce():
+        try:
+            await raw_connection.copy_from_query(query, output=queue.put, format='csv', header=True)
+        except asyncio.CancelledError:
+            # the consumer is gone and no longer reads the queue: putting the end marker could block forever
+            raise
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    task = asyncio.create_task(produce())
+    try:
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+            # the COPY must be over before the session hands the connection back
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def get_contacts(limit: int, offset: int, user: User, db: AsyncSession, after_id: int | None = None):
+    """
+    The get_contacts function returns a list of the user's contacts from the database ordered by id.
+    The contacts are plain rows rather than ORM objects, ready to be serialized as they are.
         Args:
             limit (int): The number of contacts to return.
             offset (int): The number of contacts to skip before returning results.
+            after_id (int | None): Keyset cursor, return only contacts with a greater id.
+
+    With after_id the query seeks on the (user_id, id) index instead of scanning and
+    discarding offset rows, so every page costs the same; offset is ignored then.
 
     :param limit: int: Limit the number of contacts returned
     :param offset: int: Skip the first n number of contacts
-    :param db: Session: Pass the database session to the function
-    :return: A list of contacts
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param after_id: int | None: Return the contacts after this id
+    :return: A list of rows of CONTACT_RESPONSE_COLUMNS
     :doc-author: Trelent
     """
-    contacts = db.query(Contact)
-    contacts = contacts.limit(limit).offset(offset).all()
-    return contacts
+    stmt = select(*CONTACT_RESPONSE_COLUMNS).filter_by(user_id=user.id).order_by(Contact.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    else:
+        stmt = stmt.offset(offset)
+    contacts = await db.execute(stmt)
+    return contacts.all()
+
+
+async def get_contacts_version(user: User, db: AsyncSession) -> int:
+    """
+    The get_contacts_version function returns the version of the user's contact list, a counter that
+    every committed write to the contacts increments (see bump_contacts_version).
+
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The version number
+    """
+    return await db.scalar(select(User.contacts_version).filter(User.id == user.id))
+
+
+async def bump_contacts_version(user: User, db: AsyncSession) -> None:
+    """
+    The bump_contacts_version function increments the version of the user's contact list.
+    Call it in the transaction of the write, before the commit: the increment locks the user's row,
+    so concurrent writes get distinct versions and a reader never sees the new version without the write.
+
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    await db.execute(update(User).filter(User.id == user.id).values(contacts_version=User.contacts_version + 1)
+                     .execution_options(synchronize_session=False))
 
 
-async def get_contact_by_id(contact_id: int, db: Session):
+async def get_contact_by_id(contact_id: int, user: User, db: AsyncSession):
     """
     The get_contact_by_id function returns a contact object from the database based on its id.
     Args:
         contact_id (int): The id of the desired contact.
-        db (Session): A connection to the database.
+        db (AsyncSession): A connection to the database.
 
     :param contact_id: int: Specify the id of the contact to be returned
-    :param db: Session: Pass the database session to the function
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter_by(id=contact_id).first()
+    contact = await db.scalar(select(Contact).filter_by(id=contact_id, user_id=user.id))
     return contact
 
 
-async def update_contact(body: ContactResponse, contact_id: int, db: Session):
+async def update_contact(body: ContactResponse, contact_id: int, user: User, db: AsyncSession):
     """
     The update_contact function updates a contact in the database.
         Args:
@@ -69,11 +294,12 @@ async def update_contact(body: ContactResponse, contact_id: int, db: Session):
 
     :param body: ContactResponse: Get the data from the request body
     :param contact_id: int: Identify the contact to be updated
-    :param db: Session: Connect to the database
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Connect to the database
     :return: The contact object
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter_by(id=contact_id).first()
+    contact = await db.scalar(select(Contact).filter_by(id=contact_id, user_id=user.id))
     if contact:
         contact.first_name = body.first_name
         contact.last_name = body.last_name
@@ -81,66 +307,112 @@ async def update_contact(body: ContactResponse, contact_id: int, db: Session):
         contact.phone = body.phone
         contact.birthday = body.birthday
         contact.other_info = body.other_info
-        db.commit()
+        await bump_contacts_version(user, db)
+        await db.commit()
+        # updated_at is set by the database on update: load it now, the response must not lazy load
+        await db.refresh(contact)
+        await response_cache.bump(user.id)
     return contact
 
 
-async def remove_contact(contact_id: int, db: Session):
+async def remove_contact(contact_id: int, user: User, db: AsyncSession):
     """
     The remove_contact function removes a contact from the database.
         Args:
             contact_id (int): The id of the contact to be removed.
-            db (Session): A connection to the database.
+            db (AsyncSession): A connection to the database.
 
     :param contact_id: int: Specify the id of the contact to be removed
-    :param db: Session: Pass in the database session object
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass in the database session object
     :return: The contact that was deleted
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter_by(id=contact_id).first()
+    contact = await db.scalar(select(Contact).filter_by(id=contact_id, user_id=user.id))
     if contact:
-        db.delete(contact)
-        db.commit()
+        await db.delete(contact)
+        await bump_contacts_version(user, db)
+        await db.commit()
+        await response_cache.bump(user.id)
     return contact
 
 
-async def search_contacts(query: str, db: Session):
+contacts_fts = table('contacts_fts', column('rowid'))
+
+
+def _search_postgresql(query: str, tokens: list[str]):
+    pattern = '%{}%'.format(query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+    document = literal_column(CONTACT_SEARCH_DOCUMENT)
+    matched = (Contact.first_name.ilike(pattern, escape='\\') | Contact.last_name.ilike(pattern, escape='\\')
+               | Contact.email.ilike(pattern, escape='\\'))
+    rank = func.greatest(func.similarity(Contact.first_name, query), func.similarity(Contact.last_name, query),
+                         func.similarity(Contact.email, query))
+    if tokens:
+        tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), ' & '.join(f"{token}:*" for token in tokens))
+        matched = document.op('@@')(tsquery) | matched
+        rank = func.ts_rank(document, tsquery) + rank
+    return select(*CONTACT_RESPONSE_COLUMNS).where(matched).order_by(rank.desc(), Contact.id)
+
+
+def _search_sqlite(tokens: list[str]):
+    fts_query = ' '.join(f'"{token}"*' for token in tokens)
+    return select(*CONTACT_RESPONSE_COLUMNS).join(contacts_fts, contacts_fts.c.rowid == Contact.id) \
+        .where(literal_column('contacts_fts').op('MATCH')(fts_query)) \
+        .order_by(func.bm25(literal_column('contacts_fts')), Contact.id)
+
+
+async def search_contacts(query: str, limit: int, offset: int, user: User, db: AsyncSession):
     """
     The search_contacts function searches the database for contacts that match a given query.
+    On Postgres the query is matched by word prefix against the GIN-indexed tsvector of the
+    contact and by substring through the pg_trgm indexes, ranked by ts_rank plus trigram similarity.
+    On SQLite the FTS5 index is queried by word prefix and ranked by bm25.
 
     :param query: str: Search the database for a contact
-    :param db: Session: Pass the database session to the function
-    :return: A list of contacts
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Skip the first n number of contacts
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of rows of CONTACT_RESPONSE_COLUMNS, best match first
     :doc-author: Trelent
     """
-    contacts = db.query(Contact).filter(
-        (Contact.first_name.contains(query)) |
-        (Contact.last_name.contains(query)) |
-        (Contact.email.contains(query))
-    ).all()
-    return contacts
+    tokens = re.findall(r'\w+', query)
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        stmt = _search_postgresql(query, tokens)
+    elif dialect == 'sqlite' and tokens:
+        stmt = _search_sqlite(tokens)
+    else:
+        stmt = select(*CONTACT_RESPONSE_COLUMNS).filter(
+            (Contact.first_name.contains(query, autoescape=True)) |
+            (Contact.last_name.contains(query, autoescape=True)) |
+            (Contact.email.contains(query, autoescape=True))
+        ).order_by(Contact.id)
+    contacts = await db.execute(stmt.filter(Contact.user_id == user.id).limit(limit).offset(offset))
+    return contacts.all()
 
 
-async def get_birthdays_one_week(db: Session):
+async def get_birthdays_one_week(user: User, db: AsyncSession, days: int = 7):
     """
-    The get_birthdays_one_week function returns a list of contacts whose birthdays are within the next week.
+    The get_birthdays_one_week function returns a list of contacts whose birthdays are within the next week
+    (or the given number of days), today included, soonest first.
+    The window is a range scan of the (user_id, birthday_day_of_year) index and wraps across the end of the year.
 
-    :param db: Session: Pass the database session to the function
-    :return: A list of BirthdayResponse objects
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param days: int: Length of the window in days, one week by default
+    :return: A list of rows with the fields of BirthdayResponse
     :doc-author: Trelent
     """
     today = date.today()
-    end_date = today + timedelta(days=7)
-    contacts = db.query(Contact).filter(
-        (extract('month', Contact.birthday) == today.month) & (extract('day', Contact.birthday) >= today.day)
-        & (extract('month', Contact.birthday) == end_date.month) & (extract('day', Contact.birthday) <= end_date.day)
-    ).all()
-    return [
-        BirthdayResponse(
-            id=contact.id,
-            first_name=contact.first_name,
-            last_name=contact.last_name,
-            birthday=contact.birthday
-        )
-        for contact in contacts
-    ]
+    start = birthday_day_of_year(today)
+    end = birthday_day_of_year(today + timedelta(days=days))
+    day_of_year = Contact.birthday_day_of_year
+    if start <= end:
+        window = day_of_year.between(start, end)
+    else:
+        window = (day_of_year >= start) | (day_of_year <= end)
+    contacts = await db.execute(select(*BIRTHDAY_COLUMNS).filter(Contact.user_id == user.id, window).order_by(
+        case((day_of_year >= start, day_of_year - start), else_=day_of_year + 366 - start), Contact.id
+    ))
+    return contacts.all()
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import EmailOutbox
+
+
+async def enqueue_email(recipient: str, subject: str, body: str, db: AsyncSession) -> EmailOutbox:
+    """
+    The enqueue_email function adds a rendered message to the outbox; the outbox worker sends it later.
+    It does not commit: the caller commits the message together with the change that caused it,
+    so either both are stored or neither is.
+
+    :param recipient: str: The e-mail address to send the message to
+    :param subject: str: The subject of the message
+    :param body: str: The rendered HTML body
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The outbox row
+    """
+    message = EmailOutbox(recipient=recipient, subject=subject, body=body, status='pending', attempts=0,
+                          next_attempt_at=datetime.utcnow())
+    db.add(message)
+    return message
+
+
+async def claim_emails(limit: int, lease: int, db: AsyncSession) -> list[Row]:
+    """
+    The claim_emails function takes up to limit pending messages that are due and moves their next_attempt_at
+    lease seconds ahead in one UPDATE, so other workers skip them meanwhile and a worker that dies mid-send
+    releases them when the lease runs out. On Postgres the due rows are locked with SKIP LOCKED,
+    so concurrent workers claim different rows without waiting for each other.
+
+    :param limit: int: The largest number of messages to claim
+    :param lease: int: Seconds the claimed messages stay with this worker
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Rows of id, recipient, subject, body and attempts
+    """
+    now = datetime.utcnow()
+    due = (select(EmailOutbox.id)
+           .filter(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+           .order_by(EmailOutbox.next_attempt_at)
+           .limit(limit)
+           .with_for_update(skip_locked=True))
+    result = await db.execute(
+        update(EmailOutbox)
+        .filter(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(next_attempt_at=now + timedelta(seconds=lease))
+        .returning(EmailOutbox.id, EmailOutbox.recipient, EmailOutbox.subject, EmailOutbox.body,
+                   EmailOutbox.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await db.commit()
+    return rows
+
+
+async def record_results(results: list[dict], db: AsyncSession) -> None:
+    """
+    The record_results function writes the outcome of a sent batch in one executemany UPDATE.
+    Every result is a dictionary with the id of the message and the columns to change
+    (status, attempts, next_attempt_at, last_error, sent_at).
+
+    :param results: list[dict]: The outcome of every message of the batch
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    if not results:
+        return
+    await db.execute(update(EmailOutbox), results)
+    await db.commit()
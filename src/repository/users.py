@@ -1,82 +1,87 @@
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user with that email if it exists. If no such user exists,
     it returns None.
 
     :param email: str: Pass in the email of the user we want to find
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object or none if the user is not found
     :doc-author: Trelent
     """
-    return db.query(User).filter_by(email=email).first()
+    return await db.scalar(select(User).filter_by(email=email))
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     The create_user function creates a new user in the database.
+    The user is flushed, not committed: the caller commits it together with the confirmation email.
 
     :param body: UserModel: Pass in the UserModel object that is created from the request body
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object, which is the same as what we return from our get_user function
     :doc-author: Trelent
     """
     g = Gravatar(body.email)
     new_user = User(**body.dict(), avatar=g.get_image())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.flush()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, refresh_token: str | None, db: Session) -> None:
+async def update_token(user: User, refresh_token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh token for a user.
 
     :param user: User: Pass the user object to the function
     :param refresh_token: str | None: Pass the refresh token to the update_token function
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: Nothing
     :doc-author: Trelent
     """
     user.refresh_token = refresh_token
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user.email)
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function takes in an email and a database session,
     and sets the confirmed field of the user with that email to True.
-
+    It is a single UPDATE, the user is not loaded again.
 
     :param email: str: Get the email of the user who is trying to confirm their account
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: None
     :doc-author: Trelent
     """
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.commit()
+    await db.execute(update(User).filter_by(email=email).values(confirmed=True))
+    await db.commit()
+    await user_cache.invalidate(email)
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
     The update_avatar function updates the avatar of a user.
 
     :param email: Find the user in the database
     :param url: str: Pass in the url of the avatar that we want to update
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object
     :doc-author: Trelent
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
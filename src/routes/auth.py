@@ -1,50 +1,54 @@
-from fastapi import Depends, HTTPException, status, APIRouter, Security, BackgroundTasks, Request
+from fastapi import Depends, HTTPException, status, APIRouter, Security, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db_connect import get_db
+from src.database.models import User
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.email_outbox import email_outbox
+from src.services.refresh_sessions import refresh_sessions
 
 router = APIRouter(prefix="/auth", tags=['auth'])
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
         It takes a UserModel object as input, which is validated by pydantic.
         The password is hashed using bcrypt and stored in the database.
-        A background task sends an email to the user with their username.
+        A confirmation email to the user is put into the email outbox in the same transaction as the user.
 
     :param body: UserModel: Pass the data from the request body to the function
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: The created user
     :doc-author: Trelent
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    await send_email(new_user.email, new_user.username, str(request.base_url), db)
+    await db.commit()
+    email_outbox.wake()
     return new_user
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
         It takes the username and password from the request body,
         verifies them against the database, and returns an access token if successful.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Pass a database session to the function
+    :param db: AsyncSession: Pass a database session to the function
     :return: A dict with the access_token and refresh_token
     :doc-author: Trelent
     """
@@ -53,43 +57,71 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    refresh_token = await refresh_sessions.create(user, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security),
+                        db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
-        If the user's current refresh_token does not match what was
-            passed into this function then it will return an error.
+        If the session of the refresh token is not active (it was already used, or the user logged out)
+            then all sessions of the user are ended and it will return an error.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A new access_token and refresh_token
     :doc-author: Trelent
     """
     token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    claims = await auth_service.decode_refresh_claims(token)
+    user = await repository_users.get_user_by_email(claims['sub'], db)
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    refresh_token = await refresh_sessions.rotate(user, token, claims, db)
+    access_token = await auth_service.create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
+    """
+    The logout function ends the session of the refresh token in the Authorization header,
+    the other devices of the user stay logged in. Access tokens already issued stay valid until they expire.
+
+    :param credentials: HTTPAuthorizationCredentials: Get the refresh token from the request header
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    token = credentials.credentials
+    claims = await auth_service.decode_refresh_claims(token)
+    user = await repository_users.get_user_by_email(claims['sub'], db)
+    if user is not None:
+        await refresh_sessions.revoke(user, token, claims, db)
+
+
+@router.post('/logout_all', status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all(current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    The logout_all function ends every refresh session of the current user, logging them out on all devices.
+
+    :param current_user: User: The user of the access token
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    # the cached current user is not bound to this session
+    user = await repository_users.get_user_by_email(current_user.email, db)
+    await refresh_sessions.revoke_all(user, db)
+
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
     It takes the token from the URL and uses it to get the user's email address.
@@ -100,7 +132,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     confirmed_email function which sets the 'confirmed' field of that particular User object
 
     :param token: str: Get the email from the token
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message that the email is already confirmed or a message that the email has been confirmed
     :doc-author: Trelent
     """
@@ -115,8 +147,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that will allow them
     to confirm their account. The function takes in a RequestEmail object, which contains the email of
@@ -124,9 +155,8 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     account associated with that email address, and if so it sends an email containing a confirmation link.
 
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the server
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A message to the user
     :doc-author: Trelent
     """
@@ -134,5 +164,7 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user:
         if user.confirmed:
             return {"message": "Your email is already confirmed"}
-        background_tasks.add_task(send_email, user.email, user.username, str(request.base_url))
+        await send_email(user.email, user.username, str(request.base_url), db)
+        await db.commit()
+        email_outbox.wake()
     return {"message": "Check your email for confirmation."}
@@ -1,110 +1,229 @@
 
+from datetime import date
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path, Query
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db_connect import get_db
 from src.database.models import User
+from src.services import contacts_io
 from src.services.auth import auth_service
-from src.schemas import ContactResponse, BirthdayResponse
+from src.services.etag import make_etag, etag_matches, set_etag, not_modified
+from src.services.rate_limit import RateLimiter
+from src.services.pagination import encode_cursor, decode_cursor, next_page_link
+from src.services.response_cache import response_cache
+from src.schemas import ContactResponse, BirthdayResponse, ContactFormat, ContactImportResponse, ContactBatchRequest, \
+    ContactBatchResponse
 from src.repository import contacts as repository_contacts
 
 router = APIRouter(prefix='/contacts', tags=['contacts'])
 
 
 @router.get("/", response_model=List[ContactResponse])
-async def read_contacts(limit: int = Query(10, le=100), offset: int = 0, db: Session = Depends(get_db),
+async def read_contacts(request: Request, response: Response, limit: int = Query(10, le=100), offset: int = 0,
+                        after: str | None = Query(None, description='Cursor from the Link header of the previous page'),
+                        db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)) -> List[ContactResponse]:
     """
     The read_contacts function returns a list of contacts.
+    When more contacts follow, the response has a Link header with rel="next" whose
+    URL carries an opaque after cursor; following it pages through the contacts
+    by keyset, so deep pages cost the same as the first one.
+    The ETag is derived from the version of the whole list and the page parameters;
+    a matching If-None-Match is answered with 304 before the page is queried.
+    Pages are cached in Redis with their headers until the user's contacts change.
 
+    :param request: Request: Build the next page URL
+    :param response: Response: Set the Link header
     :param limit: int: Specify the maximum number of contacts that can be returned
     :param le: Limit the maximum value of the parameter
     :param offset: int: Specify the number of contacts to skip
-    :param db: Session: Pass the database session to the repository
+    :param after: str | None: Cursor of the page to continue from
+    :param db: AsyncSession: Pass the database session to the repository
     :param current_user: User: Get the current user from the database
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = await repository_contacts.get_contacts(limit, offset, db)
-    return contacts
+    after_id = decode_cursor(after, 1)[0] if after else None
+    cache_key, cached = await response_cache.lookup(current_user.id, 'contacts', limit, offset, after_id)
+    if cached is not None:
+        etag = cached.headers['ETag']
+        return not_modified(etag) if etag_matches(request, etag) else cached
+    version = await repository_contacts.get_contacts_version(current_user, db)
+    etag = make_etag('contacts', current_user.id, version, limit, offset, after_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    contacts = await repository_contacts.get_contacts(limit + 1, offset, current_user, db, after_id=after_id)
+    if len(contacts) > limit:
+        contacts = contacts[:limit]
+        response.headers['Link'] = next_page_link(request, encode_cursor(contacts[-1].id))
+    set_etag(response, etag)
+    return await response_cache.store(cache_key, [contact._asdict() for contact in contacts], dict(response.headers))
 
 
 @router.get("/search", response_model=List[ContactResponse])
-async def search_contacts(query: str = Query(default='', min_length=1), db: Session = Depends(get_db),
+async def search_contacts(query: str = Query(default='', min_length=1), limit: int = Query(10, le=100),
+                          offset: int = 0, db: AsyncSession = Depends(get_db),
                           current_user: User = Depends(auth_service.get_current_user)):
     """
     The search_contacts function searches for contacts in the database.
+    Results are ranked, best match first, and paginated with limit and offset.
+    Results are cached in Redis until the user's contacts change.
 
     :param query: str: Pass the search query to the function
     :param min_length: Ensure that the query string is not empty
-    :param db: Session: Get the database session
+    :param limit: int: Specify the maximum number of contacts that can be returned
+    :param offset: int: Specify the number of contacts to skip
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user from the database
     :return: A list of contacts, which is the same as the return type for get_contacts
     :doc-author: Trelent
     """
-    contacts = await repository_contacts.search_contacts(query, db)
-    return contacts
+    cache_key, cached = await response_cache.lookup(current_user.id, 'search', query, limit, offset)
+    if cached is not None:
+        return cached
+    contacts = await repository_contacts.search_contacts(query, limit, offset, current_user, db)
+    return await response_cache.store(cache_key, [contact._asdict() for contact in contacts])
 
 
 @router.get("/birthday/", response_model=List[BirthdayResponse])
-async def get_contacts_birthday(db: Session = Depends(get_db),
+async def get_contacts_birthday(days: int = Query(7, ge=1, le=60), db: AsyncSession = Depends(get_db),
                                 current_user: User = Depends(auth_service.get_current_user)):
     """
-    The get_contacts_birthday function returns a list of contacts that have birthdays within the next week.
+    The get_contacts_birthday function returns a list of contacts that have birthdays within the next week,
+    or within the next 1-60 days given by the days parameter.
         The function takes in a database session and current user as parameters,
         which are used to query the database for
-        contacts with birthdays within one week. The function then returns those contacts.
+        contacts with birthdays within the window. The function then returns those contacts.
+        The list is cached in Redis for the day until the user's contacts change.
 
-    :param db: Session: Get access to the database
+    :param days: int: Length of the window in days, one week by default
+    :param db: AsyncSession: Get access to the database
     :param current_user: User: Get the current user
-    :return: A list of contacts with birthdays in the next week
+    :return: A list of contacts with upcoming birthdays
     :doc-author: Trelent
     """
-    birthdays = await repository_contacts.get_birthdays_one_week(db)
-    return birthdays
+    cache_key, cached = await response_cache.lookup(current_user.id, 'birthday', date.today(), days)
+    if cached is not None:
+        return cached
+    birthdays = await repository_contacts.get_birthdays_one_week(current_user, db, days)
+    return await response_cache.store(cache_key, [birthday._asdict() for birthday in birthdays])
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(contact_format: ContactFormat = Query(ContactFormat.ndjson, alias='format'),
+                          gzip: bool = Query(False, description='Compress the file with gzip'),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The export_contacts function downloads the whole contact book of the current user
+    as NDJSON, CSV or vCard. The file is streamed while it is read from the database.
+
+    :param contact_format: ContactFormat: Format of the file
+    :param gzip: bool: Compress the file with gzip
+    :param db: AsyncSession: Get a database session
+    :param current_user: User: Get the current user from the database
+    :return: A StreamingResponse with the file
+    """
+    filename = f"contacts.{contacts_io.FILE_EXTENSIONS[contact_format]}"
+    media_type = contacts_io.MEDIA_TYPES[contact_format]
+    if gzip:
+        filename, media_type = f"{filename}.gz", 'application/gzip'
+    return StreamingResponse(contacts_io.export_contacts(contact_format, current_user, db, compress=gzip),
+                             media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def get_contact(request: Request, response: Response, contact_id: int = Path(ge=1),
+                      db: AsyncSession = Depends(get_db),
                       current_user: User = Depends(auth_service.get_current_user)) -> ContactResponse:
     """
     The get_contact function is a GET request that returns the contact with the given ID.
     If no contact exists with that ID, it will return a 404 Not Found error.
+    The ETag comes from the id and updated_at of the contact; when it matches If-None-Match
+    the response is an empty 304.
 
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag header
     :param contact_id: int: Get the contact id from the path
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :param current_user: User: Get the current user from the database
     :return: A ContactResponse object
     :doc-author: Trelent
     """
-    contact = await repository_contacts.get_contact_by_id(contact_id, db)
+    contact = await repository_contacts.get_contact_by_id(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    etag = make_etag('contact', contact.id, contact.updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return contact
 
 
 @router.post("/", response_model=ContactResponse, description='No more than 2 requests per 10 sec',
              dependencies=[Depends(RateLimiter(times=2, seconds=10))])
-async def create_contact(body: ContactResponse, db: Session = Depends(get_db),
+async def create_contact(body: ContactResponse, db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)) -> ContactResponse:
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactResponse: Pass the data from the request body to the function
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the current user
     :return: A ContactResponse object
     :doc-author: Trelent
     """
-    contact = await repository_contacts.create_contact(body, db)
+    contact = await repository_contacts.create_contact(body, current_user, db)
     return contact
 
 
+@router.post("/import", response_model=ContactImportResponse, status_code=status.HTTP_201_CREATED)
+async def import_contacts(request: Request,
+                          contact_format: ContactFormat | None = Query(None, alias='format',
+                                                                       description='Defaults from Content-Type'),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)) -> ContactImportResponse:
+    """
+    The import_contacts function imports a contact book sent as the raw request body,
+    in CSV (with a header row), NDJSON or vCard format.
+    The body is streamed and inserted in batches; invalid rows are skipped and listed in the report.
+
+    :param request: Request: Stream the request body
+    :param contact_format: ContactFormat | None: Format of the body, taken from Content-Type when omitted
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Get the current user
+    :return: A ContactImportResponse with the number of imported rows and the row errors
+    """
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    contact_format = contact_format or contacts_io.CONTENT_TYPES.get(content_type)
+    if contact_format is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported import format")
+    return await contacts_io.import_contacts(request.stream(), contact_format, current_user, db)
+
+
+@router.post("/batch", response_model=ContactBatchResponse)
+async def batch_contacts(body: ContactBatchRequest, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)) -> ContactBatchResponse:
+    """
+    The batch_contacts function creates, updates and deletes many contacts in one request and one transaction.
+    Each operation gets its own result with an HTTP-like status: 201 created, 200 updated, 204 deleted,
+    404 when the contact does not exist and 409 when the batch already changed it.
+
+    :param body: ContactBatchRequest: The operations to apply
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Get the current user
+    :return: A ContactBatchResponse with one result per operation
+    """
+    results = await repository_contacts.batch_contacts(body.operations, current_user, db)
+    return ContactBatchResponse(results=results)
+
+
 @router.put("/{contact_id}", response_model=ContactResponse)
-async def update_contact(body: ContactResponse, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def update_contact(body: ContactResponse, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)) -> ContactResponse:
     """
     The update_contact function updates a contact in the database.
@@ -113,19 +232,19 @@ async def update_contact(body: ContactResponse, contact_id: int = Path(ge=1), db
 
     :param body: ContactResponse: Pass the contact information to be updated
     :param contact_id: int: Specify the contact id of the contact to be deleted
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Check if the user is logged in
     :return: A ContactResponse object
     :doc-author: Trelent
     """
-    contact = await repository_contacts.update_contact(body, contact_id, db)
+    contact = await repository_contacts.update_contact(body, contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
     return contact
 
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def remove_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The remove_contact function removes a contact from the database.
@@ -133,12 +252,12 @@ async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get
         and returns a dictionary containing information about that contact.
 
     :param contact_id: int: Specify the contact id of the contact to be deleted
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :param current_user: User: Get the current user from the database
     :return: The removed contact
     :doc-author: Trelent
     """
-    contact = await repository_contacts.remove_contact(contact_id, db)
+    contact = await repository_contacts.remove_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
     return contact
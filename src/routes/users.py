@@ -1,45 +1,140 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+import logging
 
-from src.database.db_connect import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import cloudinary.exceptions
+
+from src.database.db_connect import get_db, get_session
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.schemas import UserResponse
+from src.schemas import UserResponse, AvatarJobResponse
+from src.services.avatar_jobs import avatar_jobs
 from src.services.cloud_image import CloudImage
+from src.services.etag import make_etag, etag_matches, set_etag, not_modified
+from src.services.images import InvalidImage
+from src.services.storage import avatar_storage
+from src.services.upload import spool_upload
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me/", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(request: Request, response: Response,
+                        current_user: User = Depends(auth_service.get_current_user)):
     """
     The read_users_me function is a GET request that returns the current user's information.
         It requires authentication, and it uses the auth_service to get the current user.
+        The ETag is derived from the returned fields; a matching If-None-Match gets an empty 304.
 
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag header
     :param current_user: User: Get the current user object
     :return: The current user object
     :doc-author: Trelent
     """
+    etag = make_etag('user', current_user.id, current_user.username, current_user.email, current_user.avatar)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return current_user
 
 
-@router.patch('/avatar', response_model=UserResponse)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+AVATAR_REQUEST_BODY = {
+    'requestBody': {
+        'required': True,
+        'content': {
+            'multipart/form-data': {
+                'schema': {'type': 'object', 'required': ['file'],
+                           'properties': {'file': {'type': 'string', 'format': 'binary'}}},
+            },
+            'image/*': {'schema': {'type': 'string', 'format': 'binary'}},
+        },
+    },
+}
+
+
+async def upload_avatar(file: UploadFile, email: str, db: AsyncSession) -> User:
+    """
+    The upload_avatar function renders the avatar sizes from the file and stores them off the event loop,
+    saves the URL of the largest size as the avatar of the user and closes the file.
+    A file that is not an image is refused with HTTP 422, a failed upload is reported as HTTP 502.
+
+    :param file: UploadFile: The spooled upload
+    :param email: str: The email of the user
+    :param db: AsyncSession: Access the database
+    :return: The updated user
+    """
+    key = CloudImage.generate_name_avatar(email)
+    try:
+        urls = await avatar_storage.store_avatar(file.file, key)
+    except InvalidImage as err:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+    except (cloudinary.exceptions.Error, OSError) as err:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Avatar upload failed: {err}")
+    finally:
+        await file.close()
+    return await repository_users.update_avatar(email, urls[max(urls)], db)
+
+
+async def run_avatar_job(job: dict, file: UploadFile, email: str) -> None:
+    db = get_session()
+    try:
+        user = await upload_avatar(file, email, db)
+        job.update(status='done', avatar=user.avatar)
+    except HTTPException as err:
+        job.update(status='failed', detail=err.detail)
+    except Exception as err:
+        logger.exception("avatar job %s failed", job['id'])
+        job.update(status='failed', detail=str(err))
+    finally:
+        await db.close()
+    await avatar_jobs.set(job['id'], job)
+
+
+@router.patch('/avatar', response_model=UserResponse, openapi_extra=AVATAR_REQUEST_BODY,
+              responses={status.HTTP_202_ACCEPTED: {'model': AvatarJobResponse}})
+async def update_avatar_user(request: Request, background_tasks: BackgroundTasks, background: bool = False,
+                             current_user: User = Depends(auth_service.get_current_user),
+                             db: AsyncSession = Depends(get_db)):
     """
     The update_avatar_user function updates the avatar of a user.
+        The body (multipart/form-data with a file field, or the raw image) is streamed into a size-capped spool,
+        then resized to the WebP avatar sizes and stored on the upload threads.
+        With ?background=true or Prefer: respond-async the upload runs after the response:
+        the answer is 202 with the job and its status URL in the Location header.
 
-    :param file: UploadFile: Receive the file from the client
+    :param request: Request: Read the uploaded file from the body
+    :param background_tasks: BackgroundTasks: Run the upload after the response
+    :param background: bool: Upload after responding with 202
     :param current_user: User: Get the current user from the database
-    :param db: Session: Access the database
-    :return: The updated user
+    :param db: AsyncSession: Access the database
+    :return: The updated user, or the accepted job
     :doc-author: Trelent
     """
-    public_id = CloudImage.generate_name_avatar(current_user.email)
-    r = CloudImage.upload(file.file, public_id)
-    src_url = CloudImage.get_url_for_avatar(public_id, r)
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
-    return user
+    file = await spool_upload(request)
+    if background or 'respond-async' in request.headers.get('prefer', ''):
+        job = await avatar_jobs.create(current_user.id)
+        background_tasks.add_task(run_avatar_job, job, file, current_user.email)
+        location = request.url_for('get_avatar_job', job_id=job['id'])
+        return JSONResponse(AvatarJobResponse(**job).dict(), status_code=status.HTTP_202_ACCEPTED,
+                            headers={'Location': str(location)})
+    return await upload_avatar(file, current_user.email, db)
+
+
+@router.get('/avatar/jobs/{job_id}', response_model=AvatarJobResponse, name='get_avatar_job')
+async def get_avatar_job(job_id: str, current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_avatar_job function returns the status of a background avatar upload of the current user.
+
+    :param job_id: str: The id of the job
+    :param current_user: User: Get the current user from the database
+    :return: The job
+    """
+    job = await avatar_jobs.get(job_id)
+    if job is None or job['user_id'] != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
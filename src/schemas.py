@@ -1,6 +1,19 @@
-from pydantic import BaseModel, EmailStr, Field
+from enum import Enum
+
+from pydantic import BaseModel, EmailStr, Field, root_validator
 from datetime import date
-from typing import Optional
+from typing import Optional, List
+
+from src.conf.config import settings
+
+
+class ContactModel(BaseModel):
+    first_name: str
+    last_name: str
+    email: EmailStr
+    phone: str
+    birthday: date
+    other_info: Optional[str]
 
 
 class ContactResponse(BaseModel):
@@ -18,6 +31,60 @@ class ContactResponse(BaseModel):
         orm_mode = True
 
 
+class ContactFormat(str, Enum):
+    csv = 'csv'
+    ndjson = 'ndjson'
+    vcard = 'vcard'
+
+
+class ContactImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class ContactImportResponse(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ContactImportError]
+
+
+class ContactOperationType(str, Enum):
+    create = 'create'
+    update = 'update'
+    delete = 'delete'
+
+
+class ContactOperation(BaseModel):
+    op: ContactOperationType
+    id: Optional[int] = Field(None, ge=1)
+    contact: Optional[ContactModel]
+
+    @root_validator(skip_on_failure=True)
+    def check_operation(cls, values):
+        op = values['op']
+        if op != ContactOperationType.create and values.get('id') is None:
+            raise ValueError(f'{op.value} needs an id')
+        if op != ContactOperationType.delete and values.get('contact') is None:
+            raise ValueError(f'{op.value} needs a contact')
+        return values
+
+
+class ContactBatchRequest(BaseModel):
+    operations: List[ContactOperation] = Field(min_items=1, max_items=settings.contacts_batch_max_size)
+
+
+class ContactOperationResult(BaseModel):
+    index: int
+    op: ContactOperationType
+    id: Optional[int]
+    status: int
+    detail: Optional[str]
+
+
+class ContactBatchResponse(BaseModel):
+    results: List[ContactOperationResult]
+
+
 class BirthdayResponse(BaseModel):
     id: int
     first_name: str
@@ -41,6 +108,19 @@ class UserResponse(BaseModel):
         orm_mode = True
 
 
+class AvatarJobStatus(str, Enum):
+    pending = 'pending'
+    done = 'done'
+    failed = 'failed'
+
+
+class AvatarJobResponse(BaseModel):
+    id: str
+    status: AvatarJobStatus
+    avatar: Optional[str]
+    detail: Optional[str]
+
+
 class TokenModel(BaseModel):
     access_token: str
     refresh_token: str
@@ -1,14 +1,19 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer  # Bearer token
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
 from src.database.db_connect import get_db
 from src.repository import users as repository_users
+from src.services.cache import TTLCache
+from src.services.password_pool import password_pool
+from src.services.user_cache import user_cache
 from src.conf.config import settings
 
 
@@ -17,12 +22,15 @@ class Auth:
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+    token_cache = TTLCache(maxsize=settings.token_cache_size, ttl=settings.token_negative_cache_ttl)
+    invalid_token_cache = TTLCache(maxsize=settings.token_negative_cache_size, ttl=settings.token_negative_cache_ttl)
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
         password as arguments. It then uses the pwd_context object to verify that the
         plain-text password matches the hashed one.
+        The check runs on the password hashing pool, off the event loop.
 
         :param self: Represent the instance of the class
         :param plain_password: Check if the password is correct
@@ -30,19 +38,20 @@ class Auth:
         :return: A boolean value, true or false
         :doc-author: Trelent
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await password_pool.run(self.pwd_context.verify, plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
         The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+        Hashing runs on the password hashing pool, off the event loop.
 
         :param self: Represent the instance of the class
         :param password: str: Specify the password that will be hashed
         :return: A hash of the password
         :doc-author: Trelent
         """
-        return self.pwd_context.hash(password)
+        return await password_pool.run(self.pwd_context.hash, password)
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -90,15 +99,42 @@ class Auth:
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    def decode_token(self, token: str) -> dict | None:
+        """
+        The decode_token function verifies a JWT and returns its payload, or None if it is invalid.
+        Verified payloads are cached by the token's SHA-256 digest until the token's exp,
+        so a token that is sent on every request is only parsed and HMAC-checked once.
+        Invalid tokens are remembered for token_negative_cache_ttl seconds in a separate cache,
+        so a flood of bad tokens cannot evict the good ones.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded token
+        :return: The verified payload or None
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        payload = self.token_cache.get(key)
+        if payload is not None:
+            return payload
+        if self.invalid_token_cache.get(key) is not None:
+            return None
+        try:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            self.invalid_token_cache.set(key, True)
+            return None
+        self.token_cache.set(key, payload, ttl=payload["exp"] - time.time() if "exp" in payload else None)
+        return payload
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
             if it's valid, or raises an exception otherwise.
+            Resolved users are served from the per-worker user cache.
 
         :param self: Access the class attributes
         :param token: str: Get the token from the request header
-        :param db: Session: Get the database session
+        :param db: AsyncSession: Get the database session
         :return: A user object if the token is valid
         :doc-author: Trelent
         """
@@ -108,21 +144,20 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload.get("scope") == "access_token":
-                email = payload.get("sub")
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError:
+        # Decode JWT
+        payload = self.decode_token(token)
+        if payload is None or payload.get("scope") != "access_token":
+            raise credentials_exception
+        email = payload.get("sub")
+        if email is None:
             raise credentials_exception
 
-        user = await repository_users.get_user_by_email(email, db)
+        user = user_cache.get(email)
         if user is None:
-            raise credentials_exception
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise credentials_exception
+            user_cache.set(email, user)
         return user
 
     async def decode_refresh_token(self, refresh_token: str):
@@ -138,11 +173,22 @@ class Auth:
         :return: The email of the user that is associated with the refresh token
         :doc-author: Trelent
         """
+        payload = await self.decode_refresh_claims(refresh_token)
+        return payload['sub']
+
+    async def decode_refresh_claims(self, refresh_token: str) -> dict:
+        """
+        The decode_refresh_claims function verifies a refresh token and returns all of its claims,
+        the email (sub) and, for tokens of a Redis session, the session id (jti).
+
+        :param self: Represent the instance of the class
+        :param refresh_token: str: Pass the refresh token to the function
+        :return: The claims of the token
+        """
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
@@ -0,0 +1,66 @@
+import logging
+import uuid
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class AvatarJobs:
+    """
+    Status of the avatar uploads that run after the response (202 Accepted).
+    The status is kept in Redis when a client is attached, so any worker can answer the status URL,
+    and in a local TTL cache otherwise. The upload itself runs as a background task of the request that sent the file.
+    """
+    prefix = 'avatar_job'
+
+    def __init__(self, ttl: int, maxsize: int = 10000):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl)
+        self.redis: Redis | None = None
+
+    def start(self, redis: Redis) -> None:
+        self.redis = redis
+
+    def stop(self) -> None:
+        self.redis = None
+
+    async def set(self, job_id: str, job: dict) -> None:
+        self.local.set(job_id, job)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(f'{self.prefix}:{job_id}', orjson.dumps(job), ex=self.ttl)
+        except RedisError as err:
+            logger.warning("avatar job status not stored: %s", err)
+
+    async def get(self, job_id: str) -> dict | None:
+        """
+        The get function returns the status of the job: its id, user_id, status (pending, done or failed)
+        and the avatar url or the error detail.
+
+        :param self: Represent the instance of the class
+        :param job_id: str: The id returned by create
+        :return: The job or None when it is unknown or expired
+        """
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(f'{self.prefix}:{job_id}')
+                if value is not None:
+                    return orjson.loads(value)
+            except RedisError as err:
+                logger.warning("avatar job status lookup failed: %s", err)
+        return self.local.get(job_id)
+
+    async def create(self, user_id: int) -> dict:
+        job = {'id': uuid.uuid4().hex, 'user_id': user_id, 'status': 'pending', 'avatar': None, 'detail': None}
+        await self.set(job['id'], job)
+        return job
+
+
+avatar_jobs = AvatarJobs(settings.avatar_job_ttl)
@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire after a time to live.
+    It is not thread safe; it is meant to be used from the event loop of one worker.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        The get function returns the cached value for key and marks it as recently used.
+        Expired entries are dropped and count as a miss.
+
+        :param self: Represent the instance of the class
+        :param key: Hashable: The cache key
+        :param default: Any: Returned when the key is missing or expired
+        :return: The cached value or default
+        """
+        value, expires_at = self._data.get(key, (_MISSING, 0))
+        if value is _MISSING or expires_at <= time.monotonic():
+            if value is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """
+        The set function stores value under key, evicting the least recently used entries
+        when the cache is full.
+
+        :param self: Represent the instance of the class
+        :param key: Hashable: The cache key
+        :param value: Any: The value to store
+        :param ttl: float | None: Time to live in seconds, defaults to the cache ttl
+        :return: None
+        """
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
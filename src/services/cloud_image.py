@@ -1,10 +1,37 @@
 import hashlib
+import logging
 
 import cloudinary
 import cloudinary.uploader
+import cloudinary.utils
 
 from src.conf.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Versions of the SDK whose uploader is known to send every request through the private
+# module level pool cloudinary.uploader._http (see size_upload_pool); pyproject pins the SDK to them
+POOLED_UPLOADER_VERSIONS = ('1.32.',)
+
+
+def size_upload_pool(maxsize: int) -> bool:
+    """
+    The size_upload_pool function replaces the uploader's keep-alive pool, which holds one connection,
+    with one of maxsize connections, so concurrent uploads reuse connections instead of opening new ones.
+    The SDK has no public setting for it, so the pool is only replaced on the SDK versions it was checked on;
+    on any other version the uploads keep working with the default pool and a warning is logged.
+
+    :param maxsize: int: The number of connections to keep, the number of upload threads
+    :return: True when the pool was replaced
+    """
+    if not cloudinary.VERSION.startswith(POOLED_UPLOADER_VERSIONS) or not hasattr(cloudinary.uploader, '_http'):
+        logger.warning("cloudinary %s: upload connection pool left at its default size", cloudinary.VERSION)
+        return False
+    cloudinary.uploader._http = cloudinary.utils.get_http_connector(
+        cloudinary.config(), {**cloudinary.CERT_KWARGS, 'maxsize': maxsize}
+    )
+    return True
+
 
 class CloudImage:
     cloudinary.config(
@@ -13,6 +40,7 @@ class CloudImage:
         api_secret=settings.cloudinary_api_secret,
         secure=True
     )
+    size_upload_pool(settings.cloudinary_upload_workers)
 
     @staticmethod
     def generate_name_avatar(email: str):
@@ -41,21 +69,5 @@ class CloudImage:
         :return: A dictionary with the following keys:
         :doc-author: Trelent
         """
-        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
+        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True, timeout=settings.cloudinary_timeout)
         return r
-
-    @staticmethod
-    def get_url_for_avatar(public_id, r):
-        """
-        The get_url_for_avatar function takes in a public_id and an r
-        (which is the result of a cloudinary.api.resource call)
-        and returns the URL for that avatar image, which will be used to display it on the page.
-
-        :param public_id: Identify the image in cloudinary
-        :param r: Get the version of the image
-        :return: A url
-        :doc-author: Trelent
-        """
-        src_url = cloudinary.CloudinaryImage(public_id) \
-            .build_url(width=250, height=250, crop='fill', version=r.get('version'))
-        return src_url
@@ -0,0 +1,308 @@
+import codecs
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from typing import AsyncIterator, Sequence
+
+from pydantic import ValidationError
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.services.response_cache import response_cache
+from src.schemas import ContactModel, ContactFormat, ContactImportError, ContactImportResponse
+
+CONTACT_FIELDS = ('first_name', 'last_name', 'email', 'phone', 'birthday', 'other_info')
+
+MEDIA_TYPES = {
+    ContactFormat.csv: 'text/csv',
+    ContactFormat.ndjson: 'application/x-ndjson',
+    ContactFormat.vcard: 'text/vcard',
+}
+
+CONTENT_TYPES = {
+    **{media_type: contact_format for contact_format, media_type in MEDIA_TYPES.items()},
+    'application/jsonl': ContactFormat.ndjson,
+    'text/x-vcard': ContactFormat.vcard,
+}
+
+FILE_EXTENSIONS = {
+    ContactFormat.csv: 'csv',
+    ContactFormat.ndjson: 'ndjson',
+    ContactFormat.vcard: 'vcf',
+}
+
+EXPORT_FIELDS = tuple(column.name for column in repository_contacts.EXPORT_COLUMNS)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    The iter_lines function decodes a stream of UTF-8 byte chunks into lines without
+    buffering more than the current incomplete line.
+
+    :param chunks: AsyncIterator[bytes]: The request body stream
+    :return: An async iterator of lines without line endings
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    tail = ''
+    async for chunk in chunks:
+        *lines, tail = (tail + decoder.decode(chunk)).split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail.rstrip('\r')
+
+
+async def iter_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            yield row, f"invalid JSON: {err}"
+            continue
+        yield row, record if isinstance(record, dict) else "expected a JSON object"
+
+
+async def iter_csv(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    header, row, pending = None, 0, []
+    async for line in lines:
+        pending.append(line)
+        # a quoted field may span lines: wait until the quotes are balanced
+        if sum(part.count('"') for part in pending) % 2:
+            continue
+        values = next(csv.reader(['\n'.join(pending)]), [])
+        pending = []
+        if not any(values):
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"expected {len(header)} columns, got {len(values)}"
+            continue
+        yield row, dict(zip(header, values))
+    if pending:
+        yield row + 1, "unterminated quoted field"
+
+
+def _vcard_unescape(value: str) -> str:
+    return value.replace('\\n', '\n').replace('\\N', '\n').replace('\\,', ',').replace('\\;', ';') \
+        .replace('\\\\', '\\')
+
+
+def _vcard_date(value: str) -> str:
+    value = value.strip()
+    if len(value) == 8 and value.isdigit():
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    return value[:10]
+
+
+def parse_vcard(lines: list[str]) -> dict:
+    """
+    The parse_vcard function maps the properties of one unfolded vCard onto contact fields:
+    N (or FN), EMAIL, TEL, BDAY and NOTE. The first occurrence of a property wins.
+
+    :param lines: list[str]: The content lines between BEGIN:VCARD and END:VCARD
+    :return: A dictionary of contact fields
+    """
+    record, full_name = {}, None
+    for line in lines:
+        name, _, value = line.partition(':')
+        name = name.split(';')[0].split('.')[-1].upper()
+        if name == 'N':
+            last_name, first_name, *_ = [_vcard_unescape(part) for part in value.split(';')] + ['', '']
+            record.setdefault('last_name', last_name)
+            record.setdefault('first_name', first_name)
+        elif name == 'FN':
+            full_name = _vcard_unescape(value)
+        elif name == 'EMAIL':
+            record.setdefault('email', value.strip())
+        elif name == 'TEL':
+            record.setdefault('phone', value.strip())
+        elif name == 'BDAY':
+            record.setdefault('birthday', _vcard_date(value))
+        elif name == 'NOTE':
+            record.setdefault('other_info', _vcard_unescape(value))
+    if full_name and not (record.get('first_name') or record.get('last_name')):
+        record['first_name'], _, record['last_name'] = full_name.partition(' ')
+    return record
+
+
+async def iter_vcard(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    row, card = 0, None
+    async for line in lines:
+        if card is not None and line[:1] in (' ', '\t') and card:
+            card[-1] += line[1:]  # folded line
+            continue
+        upper = line.strip().upper()
+        if upper == 'BEGIN:VCARD':
+            card = []
+        elif upper == 'END:VCARD' and card is not None:
+            row += 1
+            yield row, parse_vcard(card)
+            card = None
+        elif card is not None:
+            card.append(line)
+    if card is not None:
+        yield row + 1, "missing END:VCARD"
+
+
+PARSERS = {
+    ContactFormat.csv: iter_csv,
+    ContactFormat.ndjson: iter_ndjson,
+    ContactFormat.vcard: iter_vcard,
+}
+
+
+def validate_record(record: dict) -> ContactModel | list[str]:
+    """
+    The validate_record function validates one parsed record against ContactModel.
+    Empty strings count as missing values, as CSV has no other way to say so.
+
+    :param record: dict: The parsed record
+    :return: The validated contact or a list of error messages
+    """
+    data = {field: record[field] for field in CONTACT_FIELDS if record.get(field) not in (None, '')}
+    try:
+        return ContactModel(**data)
+    except ValidationError as err:
+        return [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in err.errors()]
+
+
+async def import_contacts(chunks: AsyncIterator[bytes], contact_format: ContactFormat, user: User,
+                          db: AsyncSession) -> ContactImportResponse:
+    """
+    The import_contacts function streams an uploaded contact book into the database.
+    The body is decoded line by line, parsed in the given format, validated against ContactModel
+    and inserted in chunks of contacts_import_chunk_size rows, so memory stays bounded by the chunk
+    size. Rows that fail to parse or validate are skipped and reported; the rest are committed
+    in one transaction.
+
+    :param chunks: AsyncIterator[bytes]: The request body stream
+    :param contact_format: ContactFormat: Format of the body
+    :param user: User: The owner of the imported contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The import report
+    """
+    imported, failed, errors, batch = 0, 0, [], []
+    async for row, record in PARSERS[contact_format](iter_lines(chunks)):
+        result = validate_record(record) if isinstance(record, dict) else [record]
+        if isinstance(result, ContactModel):
+            batch.append(result.dict())
+        else:
+            failed += 1
+            if len(errors) < settings.contacts_import_max_errors:
+                errors.append(ContactImportError(row=row, errors=result))
+        if len(batch) >= settings.contacts_import_chunk_size:
+            await repository_contacts.import_contacts(batch, user, db)
+            imported += len(batch)
+            batch = []
+    await repository_contacts.import_contacts(batch, user, db)
+    imported += len(batch)
+    if imported:
+        await repository_contacts.bump_contacts_version(user, db)
+    await db.commit()
+    if imported:
+        await response_cache.bump(user.id)
+    return ContactImportResponse(imported=imported, failed=failed, errors=errors)
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _vcard_escape(value: str | None) -> str:
+    return (value or '').replace('\\', '\\\\').replace('\n', '\\n').replace(',', '\\,').replace(';', '\\;')
+
+
+def encode_csv(rows: Sequence[Row], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def encode_ndjson(rows: Sequence[Row], header: bool = False) -> bytes:
+    return ''.join(json.dumps(dict(zip(EXPORT_FIELDS, row)), default=_json_default) + '\n' for row in rows).encode()
+
+
+def encode_vcard(rows: Sequence[Row], header: bool = False) -> bytes:
+    cards = []
+    for row in rows:
+        contact = dict(zip(EXPORT_FIELDS, row))
+        lines = ['BEGIN:VCARD', 'VERSION:3.0',
+                 f"N:{_vcard_escape(contact['last_name'])};{_vcard_escape(contact['first_name'])};;;",
+                 f"FN:{_vcard_escape(' '.join(filter(None, (contact['first_name'], contact['last_name']))))}",
+                 f"EMAIL:{contact['email'] or ''}", f"TEL:{contact['phone'] or ''}"]
+        if contact['birthday']:
+            lines.append(f"BDAY:{contact['birthday'].isoformat()}")
+        if contact['other_info']:
+            lines.append(f"NOTE:{_vcard_escape(contact['other_info'])}")
+        lines.append('END:VCARD')
+        cards.append('\r\n'.join(lines) + '\r\n')
+    return ''.join(cards).encode()
+
+
+ENCODERS = {
+    ContactFormat.csv: encode_csv,
+    ContactFormat.ndjson: encode_ndjson,
+    ContactFormat.vcard: encode_vcard,
+}
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    The gzip_chunks function compresses a byte stream into a gzip stream on the fly.
+
+    :param chunks: AsyncIterator[bytes]: The uncompressed stream
+    :return: An async iterator of gzip chunks
+    """
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
+
+
+async def _encode_partitions(contact_format: ContactFormat, user: User, db: AsyncSession) -> AsyncIterator[bytes]:
+    encode = ENCODERS[contact_format]
+    header = True
+    async for partition in repository_contacts.stream_contacts(user, db):
+        yield encode(partition, header)
+        header = False
+    if header and contact_format == ContactFormat.csv:
+        yield encode([], header)
+
+
+def export_contacts(contact_format: ContactFormat, user: User, db: AsyncSession,
+                    compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    The export_contacts function streams the user's contact book in the given format.
+    Rows come from a server-side cursor, one partition at a time; on asyncpg CSV is produced
+    by Postgres with COPY ... TO STDOUT. With compress the stream is gzipped on the fly.
+
+    :param contact_format: ContactFormat: Format of the export
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param compress: bool: Gzip the stream
+    :return: An async iterator of byte chunks
+    """
+    if contact_format == ContactFormat.csv and db.get_bind().dialect.driver == 'asyncpg':
+        chunks = repository_contacts.copy_contacts_csv(user, db)
+    else:
+        chunks = _encode_partitions(contact_format, user, db)
+    return gzip_chunks(chunks) if compress else chunks
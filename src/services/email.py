@@ -1,28 +1,16 @@
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.repository import email_outbox as repository_outbox
 from src.services.auth import auth_service
-from src.conf.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="FastAPI App",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+templates = Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'), autoescape=select_autoescape())
 
 
-async def send_email(email: EmailStr, username: str, host: str):
+async def send_email(email: EmailStr, username: str, host: str, db: AsyncSession):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
         The function takes in three parameters:
@@ -30,23 +18,18 @@ async def send_email(email: EmailStr, username: str, host: str):
             -username: str, the username of the user who is trying to sign up for an account. This will be used in
                 conjunction with host (see below) and token_verification (see below) as part of a URL that will be sent
                 via email to verify their identity and allow them access into our system.
+        The message is rendered and added to the email outbox, the outbox worker delivers it,
+        so the request does not wait for the mail server and a restart does not lose the message.
+        The caller commits the session and then calls email_outbox.wake().
 
     :param email: EmailStr: Specify the email address to send the message to
     :param username: str: Pass the username to the email template
     :param host: str: Pass the hostname of the server to the template
+    :param db: AsyncSession: Pass the database session to the function
     :return: A coroutine object
     :doc-author: Trelent
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = auth_service.create_email_token({"sub": email})
+    body = templates.get_template("email_template.html").render(host=host, username=username,
+                                                                token=token_verification)
+    await repository_outbox.enqueue_email(email, "Confirm your email", body, db)
@@ -0,0 +1,250 @@
+"""
+Worker that sends the messages of the e-mail outbox.
+
+It runs inside the API process (started from main.py when mail_outbox_worker is on) or alone:
+
+    python -m src.services.email_outbox
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Callable
+
+import aiosmtplib
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.conf.config import settings
+from src.database.db_connect import get_session
+from src.repository import email_outbox as repository_outbox
+
+logger = logging.getLogger(__name__)
+
+# errors of the connection or the login rather than of the message: the message is retried later. The timeouts
+# are listed on their own, before Python 3.11 asyncio.TimeoutError is not an OSError
+CONNECTION_ERRORS = (OSError, aiosmtplib.SMTPTimeoutError, aiosmtplib.SMTPAuthenticationError,
+                     aiosmtplib.SMTPHeloError, aiosmtplib.SMTPNotSupported)
+
+
+def get_smtp_args() -> dict:
+    return {
+        'hostname': settings.mail_server,
+        'port': settings.mail_port,
+        'username': settings.mail_username,
+        'password': settings.mail_password,
+        'use_tls': settings.mail_ssl_tls,
+        'start_tls': settings.mail_starttls,
+        'timeout': settings.mail_timeout,
+    }
+
+
+class EmailOutboxWorker:
+    """
+    Drains the email_outbox table in batches. Every batch is shared by `concurrency` SMTP connections
+    that stay open between batches, so a message costs one SMTP transaction rather than a connect, TLS handshake
+    and login. A failed message is retried with exponential backoff; a permanent (5xx) rejection or running out of
+    attempts marks it failed. The worker sleeps until wake() is called or poll_interval passes.
+    """
+    sender_name = 'FastAPI App'
+
+    def __init__(self, session_factory: Callable = get_session, smtp_args: dict | None = None,
+                 batch_size: int = 50, concurrency: int = 2, max_attempts: int = 8, backoff: float = 30.0,
+                 backoff_max: float = 3600.0, lease: int = 300, poll_interval: float = 10.0):
+        self.session_factory = session_factory
+        self.smtp_args = smtp_args
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._connections: list[aiosmtplib.SMTP | None] = [None] * concurrency
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = self._wake = None
+        for slot in range(self.concurrency):
+            await self._disconnect(slot, quit_=True)
+
+    def wake(self) -> None:
+        """
+        The wake function tells a sleeping worker that a message was enqueued, so it is sent right away.
+        Without a started worker (tests, a separate worker process) it does nothing.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                sent = await self.drain()
+                failures = 0
+            except (SQLAlchemyError, OSError) as err:
+                logger.warning("email outbox: database error: %s", err)
+                sent = 0
+            except Exception:
+                # whatever went wrong, the worker must not die and leave the outbox unsent until a restart
+                failures += 1
+                delay = min(self.poll_interval * 2 ** (failures - 1), self.backoff_max)
+                logger.exception("email outbox: unexpected error, retrying in %.0f seconds", delay)
+                await asyncio.sleep(delay)
+                continue
+            if sent == self.batch_size:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> int:
+        """
+        The drain function claims one batch of due messages, sends it and records the results.
+
+        :param self: Represent the instance of the class
+        :return: The number of claimed messages
+        """
+        db = self.session_factory()
+        try:
+            rows = await repository_outbox.claim_emails(self.batch_size, self.lease, db)
+            if not rows:
+                return 0
+            results = await self.send_batch(rows)
+            await repository_outbox.record_results(results, db)
+            return len(rows)
+        finally:
+            await db.close()
+
+    async def send_batch(self, rows: list[Row]) -> list[dict]:
+        queue = asyncio.Queue()
+        for row in rows:
+            queue.put_nowait(row)
+        results = []
+        await asyncio.gather(*(self._send_queued(slot, queue, results) for slot in range(self.concurrency)))
+        now = datetime.utcnow()
+        # a slot whose connection failed stops early; its leftovers are retried without counting an attempt
+        while not queue.empty():
+            row = queue.get_nowait()
+            results.append(self._result(row, row.attempts, None, 'pending',
+                                        now + timedelta(seconds=self.backoff)))
+        return results
+
+    async def _send_queued(self, slot: int, queue: asyncio.Queue, results: list[dict]) -> None:
+        while not queue.empty():
+            row = queue.get_nowait()
+            attempts = row.attempts + 1
+            try:
+                await self._send(slot, self.build_message(row))
+            except CONNECTION_ERRORS as err:
+                logger.warning("email outbox: SMTP connection failed: %s", err)
+                results.append(self._failure(row, attempts, str(err) or type(err).__name__))
+                await self._disconnect(slot)
+                return
+            except aiosmtplib.SMTPResponseException as err:
+                error = f'{err.code} {err.message}'
+                results.append(self._failure(row, attempts, error, permanent=err.code >= 500))
+                continue
+            except aiosmtplib.SMTPRecipientsRefused as err:
+                error = '; '.join(f'{refused.code} {refused.message}' for refused in err.recipients)
+                permanent = all(refused.code >= 500 for refused in err.recipients)
+                results.append(self._failure(row, attempts, error, permanent=permanent))
+                continue
+            results.append(self._result(row, attempts, None, 'sent', datetime.utcnow(), sent_at=datetime.utcnow()))
+
+    async def _send(self, slot: int, message: EmailMessage) -> None:
+        # a reused connection may have been closed by the server while idle: reconnect once and resend
+        for retry in (False, True):
+            smtp = await self._connect(slot)
+            try:
+                await smtp.send_message(message)
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                await self._disconnect(slot)
+                if retry:
+                    raise
+
+    async def _connect(self, slot: int) -> aiosmtplib.SMTP:
+        smtp = self._connections[slot]
+        if smtp is None or not smtp.is_connected:
+            smtp = aiosmtplib.SMTP(**(self.smtp_args if self.smtp_args is not None else get_smtp_args()))
+            await smtp.connect()
+            self._connections[slot] = smtp
+        return smtp
+
+    async def _disconnect(self, slot: int, quit_: bool = False) -> None:
+        smtp, self._connections[slot] = self._connections[slot], None
+        if smtp is None or not smtp.is_connected:
+            return
+        try:
+            if quit_:
+                await smtp.quit()
+            else:
+                smtp.close()
+        except aiosmtplib.SMTPException:
+            smtp.close()
+
+    def build_message(self, row: Row) -> EmailMessage:
+        message = EmailMessage()
+        message['From'] = formataddr((self.sender_name, settings.mail_from))
+        message['To'] = row.recipient
+        message['Subject'] = row.subject
+        message.set_content(row.body, subtype='html')
+        return message
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+        # jitter, so messages that failed together are not retried together
+        return delay * random.uniform(0.5, 1.0)
+
+    def _failure(self, row: Row, attempts: int, error: str, permanent: bool = False) -> dict:
+        if permanent or attempts >= self.max_attempts:
+            logger.error("email outbox: giving up on message %s to %s: %s", row.id, row.recipient, error)
+            return self._result(row, attempts, error, 'failed', datetime.utcnow())
+        retry_at = datetime.utcnow() + timedelta(seconds=self.retry_delay(attempts))
+        return self._result(row, attempts, error, 'pending', retry_at)
+
+    @staticmethod
+    def _result(row: Row, attempts: int, error: str | None, status: str, next_attempt_at: datetime,
+                sent_at: datetime | None = None) -> dict:
+        return {'id': row.id, 'status': status, 'attempts': attempts, 'next_attempt_at': next_attempt_at,
+                'last_error': error[:1000] if error else None, 'sent_at': sent_at}
+
+
+email_outbox = EmailOutboxWorker(
+    batch_size=settings.mail_outbox_batch_size,
+    concurrency=settings.mail_outbox_concurrency,
+    max_attempts=settings.mail_outbox_max_attempts,
+    backoff=settings.mail_outbox_backoff,
+    backoff_max=settings.mail_outbox_backoff_max,
+    lease=settings.mail_outbox_lease,
+    poll_interval=settings.mail_outbox_poll_interval,
+)
+
+
+async def main() -> None:
+    email_outbox.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await email_outbox.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
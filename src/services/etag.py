@@ -0,0 +1,59 @@
+import hashlib
+
+from fastapi import Request, Response, status
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts) -> str:
+    """
+    The make_etag function builds a strong entity tag from the values that identify a version of a resource,
+    such as an id and an updated_at timestamp.
+
+    :param parts: The version values, joined by their str()
+    :return: The quoted ETag value
+    """
+    digest = hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    The etag_matches function checks the If-None-Match header of the request against an ETag.
+    As RFC 9110 requires for If-None-Match the comparison is weak, so a W/ prefix is ignored.
+
+    :param request: Request: The current request
+    :param etag: str: The current ETag of the resource
+    :return: True when the client already has this version
+    """
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+def set_etag(response: Response, etag: str) -> None:
+    """
+    The set_etag function adds the ETag and Cache-Control headers to a response, so clients keep
+    the body but revalidate it on every use.
+
+    :param response: Response: The response to decorate
+    :param etag: str: The ETag of the body
+    :return: None
+    """
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    """
+    The not_modified function builds the empty 304 response sent when the client's copy is current.
+
+    :param etag: str: The ETag of the resource
+    :return: A 304 Response
+    """
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag(response, etag)
+    return response
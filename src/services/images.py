@@ -0,0 +1,40 @@
+import io
+from typing import BinaryIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.conf.config import settings
+
+Image.MAX_IMAGE_PIXELS = settings.avatar_max_pixels
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def make_avatars(file: BinaryIO, sizes: tuple[int, ...], quality: int = 80) -> dict[int, bytes]:
+    """
+    The make_avatars function decodes an uploaded image and renders a square WebP of every size:
+    the image is turned upright by its EXIF orientation, cropped to the centre and downscaled.
+    It is CPU bound and blocking, run it on a worker thread.
+
+    :param file: BinaryIO: The uploaded image
+    :param sizes: tuple[int, ...]: Widths (and heights) in pixels
+    :param quality: int: WebP quality, 0..100
+    :return: The encoded WebP bytes of every size
+    """
+    try:
+        with Image.open(file) as image:
+            # decode only what the largest size needs (JPEG draft mode), then fix the orientation
+            image.draft('RGB', (max(sizes), max(sizes)))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as err:
+        raise InvalidImage(f"Not a supported image: {err}") from err
+    avatars = {}
+    for size in sorted(sizes, reverse=True):
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', quality=quality, method=4)
+        avatars[size] = buffer.getvalue()
+    return avatars
@@ -0,0 +1,172 @@
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import Request, Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from starlette.routing import Match
+
+from src.database.db_connect import get_pool_stats
+from src.services.password_pool import password_pool
+from src.services.user_cache import user_cache
+
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+UNMATCHED_ROUTE = '<unmatched>'
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests', ['method', 'route', 'status'])
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'route', 'status'],
+                            buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10))
+REQUESTS_IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP requests being served', ['method', 'route'],
+                             multiprocess_mode='livesum')
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'Database queries per HTTP request', ['route'],
+                            buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+REQUEST_QUERY_TIME = Histogram('http_request_db_seconds', 'Database time per HTTP request', ['route'],
+                               buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+QUERIES = Counter('db_queries_total', 'Database queries')
+QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Database query latency',
+                          buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+
+DB_POOL_GAUGES = {key: Gauge(f'db_pool_{key}', f'Connection pool {key.replace("_", " ")}', multiprocess_mode='livesum')
+                  for key in ('size', 'checked_in', 'checked_out', 'overflow')}
+DB_POOL_COUNTERS = {
+    'checkouts': Counter('db_pool_checkouts_total', 'Connection pool checkouts'),
+    'timeouts': Counter('db_pool_timeouts_total', 'Connection pool checkouts that timed out'),
+    'wait_seconds_total': Counter('db_pool_checkout_wait_seconds_total', 'Time spent waiting for a connection'),
+}
+PASSWORD_POOL_GAUGES = {key: Gauge(f'password_pool_{key}', f'Password hashing pool {key}', multiprocess_mode='livesum')
+                        for key in ('workers', 'active', 'queued')}
+PASSWORD_POOL_COUNTERS = {key: Counter(f'password_pool_{key}_total', f'Password hashing jobs {key}')
+                          for key in ('completed', 'rejected', 'timeouts')}
+USER_CACHE_GAUGES = {'size': Gauge('user_cache_size', 'Cached users', multiprocess_mode='livesum')}
+USER_CACHE_COUNTERS = {key: Counter(f'user_cache_{key}_total', f'User cache {key}') for key in ('hits', 'misses')}
+
+_request_queries: ContextVar[list | None] = ContextVar('request_queries', default=None)
+# "METHOD /route/template" of the request being served, for logs
+current_route: ContextVar[str | None] = ContextVar('current_route', default=None)
+
+
+def route_template(request: Request) -> str:
+    """
+    The route_template function finds the path template of the route that serves the request,
+    e.g. /api/contacts/{contact_id}, so metrics are labeled per route and not per URL.
+
+    :param request: Request: The current request
+    :return: The path template, or <unmatched> for unknown paths
+    """
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+def instrument_engine(engine) -> None:
+    """
+    The instrument_engine function counts and times every statement executed through the engine,
+    globally and for the request being served.
+
+    :param engine: Engine | AsyncEngine: The engine to instrument
+    :return: None
+    """
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        QUERIES.inc()
+        QUERY_LATENCY.observe(elapsed)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += elapsed
+
+
+class ComponentStats:
+    """
+    Publishes the in-process statistics of the connection pool, the password hashing pool and the user cache.
+    They are read at most once per interval, from the request path, because a multi-process registry only
+    aggregates values written to it; totals are published as counter increments since the last read.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._next_sync = 0.0
+        self._last: dict[Counter, float] = {}
+
+    def sync(self) -> None:
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.interval
+        for stats, gauges, counters in ((get_pool_stats(), DB_POOL_GAUGES, DB_POOL_COUNTERS),
+                                        (password_pool.stats(), PASSWORD_POOL_GAUGES, PASSWORD_POOL_COUNTERS),
+                                        (user_cache.stats(), USER_CACHE_GAUGES, USER_CACHE_COUNTERS)):
+            for key, gauge in gauges.items():
+                gauge.set(stats.get(key, 0))
+            for key, counter in counters.items():
+                value = stats.get(key, 0)
+                delta = value - self._last.get(counter, 0)
+                if delta > 0:
+                    counter.inc(delta)
+                self._last[counter] = value
+
+
+component_stats = ComponentStats()
+
+
+async def metrics_middleware(request: Request, call_next):
+    """
+    The metrics_middleware function records the count, latency, in-flight number and database usage
+    of every request, labeled by method, route template and status.
+
+    :param request: Request: The current request
+    :param call_next: Call the next middleware in the chain
+    :return: The response
+    """
+    method, route = request.method, route_template(request)
+    queries = [0, 0.0]
+    token = _request_queries.set(queries)
+    route_token = current_route.set(f'{method} {route}')
+    in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+    in_progress.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        in_progress.dec()
+        _request_queries.reset(token)
+        current_route.reset(route_token)
+        REQUESTS.labels(method, route, status).inc()
+        REQUEST_LATENCY.labels(method, route, status).observe(elapsed)
+        REQUEST_QUERIES.labels(route).observe(queries[0])
+        REQUEST_QUERY_TIME.labels(route).observe(queries[1])
+        component_stats.sync()
+
+
+def metrics_response() -> Response:
+    """
+    The metrics_response function renders all metrics in the Prometheus text format.
+    With PROMETHEUS_MULTIPROC_DIR set the values of all worker processes are aggregated.
+
+    :return: The /metrics response
+    """
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead() -> None:
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,47 @@
+import base64
+import json
+
+from fastapi import HTTPException, Request, status
+
+
+def encode_cursor(*values: int) -> str:
+    """
+    The encode_cursor function packs the keyset values of the last row of a page into an opaque,
+    URL-safe cursor string.
+
+    :param values: int: The ordering key values of the last row
+    :return: The cursor string
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> tuple[int, ...]:
+    """
+    The decode_cursor function unpacks a cursor made by encode_cursor.
+    Anything that is not a list of size integers is rejected with HTTP 400.
+
+    :param cursor: str: The cursor from the query string
+    :param size: int: Number of keyset values the cursor must hold
+    :return: A tuple of the keyset values
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size or not all(type(value) is int for value in values):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return tuple(values)
+
+
+def next_page_link(request: Request, cursor: str) -> str:
+    """
+    The next_page_link function builds an RFC 8288 Link header value pointing to the next page.
+    It keeps the other query parameters and replaces offset with the after cursor.
+
+    :param request: Request: The current request
+    :param cursor: str: The cursor of the next page
+    :return: The Link header value
+    """
+    url = request.url.remove_query_params("offset").include_query_params(after=cursor)
+    return f'<{url}>; rel="next"'
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+
+
+class PasswordHashPool:
+    """
+    Bounded executor for bcrypt hashing and verification.
+    The bcrypt extension releases the GIL, so a small thread pool hashes in parallel
+    and keeps ~100-300 ms of CPU per call off the event loop.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, timeout: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _call(self, fn, *args):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, fn, *args):
+        """
+        The run function executes fn(*args) on the pool and awaits the result.
+        Calls over the concurrency cap wait in the queue; if the queue is full, or the
+        call does not finish within the timeout, the request is refused with HTTP 503.
+
+        :param self: Represent the instance of the class
+        :param fn: The blocking callable, e.g. CryptContext.verify
+        :param args: Arguments passed to fn
+        :return: The result of fn
+        """
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Password service is busy, try again later")
+            self.queued += 1
+        future = self._executor.submit(self._call, fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if future.cancelled():
+                # never started, so _call did not get the chance to leave the queue
+                with self._lock:
+                    self.queued -= 1
+            with self._lock:
+                self.timeouts += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Password service timeout, try again later")
+
+    def stats(self) -> dict:
+        """
+        The stats function returns a snapshot of the pool counters.
+        Saturation is the share of busy workers; queued > 0 means requests are waiting.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary with the pool metrics
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "saturation": self.active / self.max_workers,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_pool = PasswordHashPool(
+    max_workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_queue,
+    timeout=settings.password_hash_timeout,
+)
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import math
+import time
+
+from fastapi import HTTPException, Request, Response, status
+from redis.asyncio import Redis
+from redis.exceptions import NoScriptError, RedisError
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Sliding window counter: the count of the previous fixed window, weighted by how much of it still overlaps
+# the sliding window, plus the count of the current one. Grants up to ARGV[3] requests at once and returns
+# {granted, milliseconds until a request may be granted}. Redis time is used, so all workers share one clock;
+# both windows hash to the slot of KEYS[1] thanks to its {hash tag}.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local current_window = math.floor(now / window)
+local elapsed = now - current_window * window
+local current_key = KEYS[1] .. ':' .. current_window
+local current = tonumber(redis.call('GET', current_key) or '0')
+local previous = tonumber(redis.call('GET', KEYS[1] .. ':' .. (current_window - 1)) or '0')
+local used = previous * (window - elapsed) / window + current
+local granted = math.min(requested, math.floor(limit - used))
+if granted > 0 then
+    redis.call('INCRBY', current_key, granted)
+    redis.call('PEXPIRE', current_key, window * 2)
+    return {granted, 0}
+end
+local retry = window - elapsed
+if previous > 0 then
+    retry = math.min(retry, math.ceil((used - limit + 1) * window / previous))
+end
+return {0, retry}
+"""
+
+
+class TokenBucket:
+    """
+    Tokens a worker may spend without asking anyone. Leased from Redis they are a fixed batch valid for one window;
+    as the local fallback they refill continuously at times per seconds.
+    """
+    __slots__ = ('tokens', 'updated', 'expires_at', 'blocked_until')
+
+    def __init__(self, tokens: float, now: float, expires_at: float = math.inf):
+        self.tokens = tokens
+        self.updated = now
+        self.expires_at = expires_at
+        self.blocked_until = 0.0
+
+    def refill(self, now: float, capacity: int, rate: float) -> None:
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+
+class RateLimits:
+    """
+    Two tier rate limiter. Redis keeps one sliding window per key for all workers; a worker does not ask it
+    for every request but leases a batch of requests (batch_fraction of the limit) and spends them locally,
+    and remembers a refusal until the retry time, so most requests never leave the process.
+    Concurrent requests that find no local tokens share one Redis call. A worker can overshoot the limit by at
+    most one unspent batch. Without Redis (not started, or failing with fail_open) every worker enforces the limit
+    on its own with a token bucket; with fail_open off a Redis failure refuses the request with HTTP 503.
+    After a failure Redis is left alone for retry_interval seconds, so requests do not each wait for a dead server.
+    """
+    prefix = 'rate_limit'
+
+    def __init__(self, batch_fraction: float = 0.1, fail_open: bool = True, maxsize: int = 100000,
+                 retry_interval: float = 5.0):
+        self.batch_fraction = batch_fraction
+        self.fail_open = fail_open
+        self.retry_interval = retry_interval
+        self._redis_down_until = 0.0
+        self.leases = TTLCache(maxsize, 3600)
+        self.local = TTLCache(maxsize, 3600)
+        self.redis: Redis | None = None
+        self._sha: str | None = None
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def start(self, redis: Redis) -> None:
+        self.redis = redis
+        self._sha = None
+        self._redis_down_until = 0.0
+
+    def stop(self) -> None:
+        self.redis = None
+
+    def clear(self) -> None:
+        self.leases.clear()
+        self.local.clear()
+
+    def acquire_local(self, key: str, times: int, seconds: float) -> float:
+        """
+        The acquire_local function takes a token from the worker's own bucket of key.
+
+        :param self: Represent the instance of the class
+        :param key: str: The limited client and route
+        :param times: int: Requests allowed per period
+        :param seconds: float: The period
+        :return: 0 when the request is allowed, else the seconds to wait
+        """
+        now = time.monotonic()
+        bucket = self.local.get(key)
+        if bucket is None:
+            bucket = TokenBucket(times, now)
+            self.local.set(key, bucket, ttl=seconds)
+        rate = times / seconds
+        bucket.refill(now, times, rate)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / rate
+
+    async def acquire(self, key: str, times: int, seconds: float) -> float:
+        """
+        The acquire function spends one request of the limit of key: from the local lease if it has tokens left,
+        otherwise from a new batch leased from the Redis sliding window.
+
+        :param self: Represent the instance of the class
+        :param key: str: The limited client and route
+        :param times: int: Requests allowed per period
+        :param seconds: float: The period
+        :return: 0 when the request is allowed, else the seconds to wait
+        """
+        while True:
+            now = time.monotonic()
+            if self.redis is None or self._redis_down_until > now:
+                return self._unavailable(key, times, seconds)
+            lease = self.leases.get(key)
+            if lease is not None:
+                if lease.tokens >= 1 and lease.expires_at > now:
+                    lease.tokens -= 1
+                    return 0.0
+                if lease.blocked_until > now:
+                    return lease.blocked_until - now
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            return await self._lease(key, times, seconds)
+        finally:
+            del self._inflight[key]
+            future.set_result(None)
+
+    def _unavailable(self, key: str, times: int, seconds: float) -> float:
+        if self.redis is not None and not self.fail_open:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Rate limiter unavailable, try again later")
+        return self.acquire_local(key, times, seconds)
+
+    async def _lease(self, key: str, times: int, seconds: float) -> float:
+        batch = max(1, int(times * self.batch_fraction))
+        try:
+            granted, retry_ms = await self._evaluate(key, times, seconds, batch)
+        except (RedisError, OSError) as err:
+            logger.warning("rate limit: Redis unavailable: %s", err)
+            self._redis_down_until = time.monotonic() + self.retry_interval
+            return self._unavailable(key, times, seconds)
+        now = time.monotonic()
+        lease = TokenBucket(max(granted - 1, 0), now, expires_at=now + seconds)
+        if not granted:
+            lease.blocked_until = now + retry_ms / 1000
+        self.leases.set(key, lease, ttl=seconds)
+        return 0.0 if granted else retry_ms / 1000
+
+    async def _evaluate(self, key: str, times: int, seconds: float, batch: int) -> tuple[int, int]:
+        args = (1, f'{self.prefix}:{{{key}}}', times, int(seconds * 1000), batch)
+        if self._sha is None:
+            self._sha = await self.redis.script_load(SLIDING_WINDOW_SCRIPT)
+        try:
+            granted, retry_ms = await self.redis.evalsha(self._sha, *args)
+        except NoScriptError:
+            # the script cache was flushed or Redis restarted
+            self._sha = await self.redis.script_load(SLIDING_WINDOW_SCRIPT)
+            granted, retry_ms = await self.redis.evalsha(self._sha, *args)
+        return int(granted), int(retry_ms)
+
+
+rate_limits = RateLimits(settings.rate_limit_batch_fraction, settings.rate_limit_fail_open,
+                         settings.rate_limit_local_keys, settings.rate_limit_retry_interval)
+
+
+def get_identity(request: Request) -> str:
+    """
+    The get_identity function returns whom a request is counted for: the user of a valid access token,
+    otherwise the client address. The token is checked with the cached decode, no database lookup.
+
+    :param request: Request: The request
+    :return: user:<email> or ip:<address>
+    """
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        payload = auth_service.decode_token(token)
+        if payload is not None and payload.get('scope') == 'access_token' and payload.get('sub'):
+            return f"user:{payload['sub']}"
+    forwarded = request.headers.get('x-forwarded-for')
+    if forwarded and settings.rate_limit_trust_forwarded:
+        return f"ip:{forwarded.split(',')[0].strip()}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class RateLimiter:
+    """
+    Dependency that allows times requests per seconds to one route for each user (or anonymous client address):
+
+        @router.post("/", dependencies=[Depends(RateLimiter(times=2, seconds=10))])
+
+    Refused requests get HTTP 429 with Retry-After.
+    """
+
+    def __init__(self, times: int, seconds: float, name: str | None = None):
+        self.times = times
+        self.seconds = seconds
+        self.name = name
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        route = request.scope.get('route')
+        name = self.name or f"{request.method}:{route.path if route is not None else request.url.path}"
+        retry_after = await rate_limits.acquire(f'{name}:{get_identity(request)}', self.times, self.seconds)
+        if retry_after > 0:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={'Retry-After': str(math.ceil(retry_after))})
@@ -0,0 +1,212 @@
+import logging
+import uuid
+
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import User
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+
+logger = logging.getLogger(__name__)
+
+# Adds the session ARGV[1] (a jti) to KEYS[2], the user's sorted set of sessions scored by their expiry, dropping
+# the expired ones and, above ARGV[3] sessions, the oldest. The session key is ARGV[4] .. jti and expires in ARGV[2]
+# milliseconds of Redis time; all keys of a user share a {hash tag}.
+ADD_SESSION = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local ttl = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+redis.call('SET', ARGV[4] .. ARGV[1], '1', 'PX', ttl)
+redis.call('ZADD', KEYS[2], now + ttl, ARGV[1])
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[3])
+if excess > 0 then
+    for _, jti in ipairs(redis.call('ZRANGE', KEYS[2], 0, excess - 1)) do
+        redis.call('DEL', ARGV[4] .. jti)
+    end
+    redis.call('ZREMRANGEBYRANK', KEYS[2], 0, excess - 1)
+end
+redis.call('PEXPIRE', KEYS[2], ttl)
+return 1
+"""
+# Ends the session KEYS[1] (jti ARGV[5]) and adds ARGV[1] instead; returns 0 and changes nothing
+# when KEYS[1] is not an active session.
+ROTATE_SESSION = """
+if redis.call('DEL', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[5])
+""" + ADD_SESSION
+REVOKE_SESSION = """
+redis.call('ZREM', KEYS[2], ARGV[1])
+return redis.call('DEL', KEYS[1])
+"""
+REVOKE_ALL_SESSIONS = """
+local jtis = redis.call('ZRANGE', KEYS[1], 0, -1)
+for _, jti in ipairs(jtis) do
+    redis.call('DEL', ARGV[1] .. jti)
+end
+redis.call('DEL', KEYS[1])
+return #jtis
+"""
+
+
+class RefreshSessions:
+    """
+    Refresh token sessions. With Redis (refresh_session_store = 'redis' and a client attached) every refresh token
+    carries a jti naming a session key that expires with the token: a user has a session per device, and a refresh,
+    a logout or a logout everywhere is one Redis call with no write to the users table.
+    Without Redis, or when it fails at login, the session is kept in users.refresh_token, one per user, as before;
+    those sessions stay valid when the store is switched to Redis and move there on their next refresh.
+    A refresh token presented again after it was rotated is taken as stolen, and every session of the user ends.
+    """
+    prefix = 'refresh_session'
+
+    def __init__(self, ttl: int, max_sessions: int, backend: str = 'redis'):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.backend = backend
+        self.redis: Redis | None = None
+        self.scripts = {}
+
+    def start(self, redis: Redis) -> None:
+        self.redis = redis
+        self.scripts = {'add': redis.register_script(ADD_SESSION),
+                        'rotate': redis.register_script(ROTATE_SESSION),
+                        'revoke': redis.register_script(REVOKE_SESSION),
+                        'revoke_all': redis.register_script(REVOKE_ALL_SESSIONS)}
+
+    def stop(self) -> None:
+        self.redis = None
+        self.scripts = {}
+
+    @property
+    def uses_redis(self) -> bool:
+        return self.backend == 'redis' and self.redis is not None
+
+    def keys(self, user: User) -> tuple[str, str]:
+        """
+        The keys function returns the prefix of the session keys of the user and the key of their sorted set.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user
+        :return: refresh_session:{id}: and refresh_sessions:{id}
+        """
+        return f'{self.prefix}:{{{user.id}}}:', f'{self.prefix}s:{{{user.id}}}'
+
+    def _args(self, jti: str, session_prefix: str) -> list:
+        return [jti, self.ttl * 1000, self.max_sessions, session_prefix]
+
+    async def _token(self, user: User, jti: str) -> str:
+        return await auth_service.create_refresh_token(data={"sub": user.email, "jti": jti}, expires_delta=self.ttl)
+
+    async def _create_in_database(self, user: User, db: AsyncSession) -> str:
+        token = await self._token(user, uuid.uuid4().hex)
+        await repository_users.update_token(user, token, db)
+        return token
+
+    @staticmethod
+    def _unavailable(err: RedisError) -> HTTPException:
+        logger.warning("refresh sessions: Redis unavailable: %s", err)
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                             detail="Session store unavailable, try again later")
+
+    async def create(self, user: User, db: AsyncSession) -> str:
+        """
+        The create function starts a new session of the user and returns its refresh token.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user who logged in
+        :param db: AsyncSession: Pass the database session to the function
+        :return: The refresh token
+        """
+        if not self.uses_redis:
+            return await self._create_in_database(user, db)
+        jti = uuid.uuid4().hex
+        session_prefix, index = self.keys(user)
+        try:
+            await self.scripts['add'](keys=[session_prefix + jti, index], args=self._args(jti, session_prefix))
+        except RedisError as err:
+            logger.warning("refresh sessions: Redis unavailable, session kept in the database: %s", err)
+            return await self._create_in_database(user, db)
+        return await self._token(user, jti)
+
+    async def rotate(self, user: User, token: str, claims: dict, db: AsyncSession) -> str:
+        """
+        The rotate function ends the session of a refresh token and starts the next one.
+        A token whose session is not active (rotated, logged out or evicted) ends every session of the user
+        and is refused with HTTP 401.
+
+        :param self: Represent the instance of the class
+        :param user: User: The owner of the token
+        :param token: str: The presented refresh token
+        :param claims: dict: The verified claims of the token
+        :param db: AsyncSession: Pass the database session to the function
+        :return: The new refresh token
+        """
+        jti = claims.get('jti')
+        if jti and self.uses_redis:
+            new_jti = uuid.uuid4().hex
+            session_prefix, index = self.keys(user)
+            try:
+                rotated = await self.scripts['rotate'](keys=[session_prefix + jti, index],
+                                                       args=self._args(new_jti, session_prefix) + [jti])
+            except RedisError as err:
+                raise self._unavailable(err)
+            if rotated:
+                return await self._token(user, new_jti)
+        if user.refresh_token == token:
+            if self.uses_redis:
+                # a session kept in the database: move it to Redis
+                await repository_users.update_token(user, None, db)
+                return await self.create(user, db)
+            return await self._create_in_database(user, db)
+        await self.revoke_all(user, db)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    async def revoke(self, user: User, token: str, claims: dict, db: AsyncSession) -> None:
+        """
+        The revoke function ends the session of one refresh token, logging out one device.
+
+        :param self: Represent the instance of the class
+        :param user: User: The owner of the token
+        :param token: str: The refresh token
+        :param claims: dict: The verified claims of the token
+        :param db: AsyncSession: Pass the database session to the function
+        :return: None
+        """
+        jti = claims.get('jti')
+        if jti and self.uses_redis:
+            session_prefix, index = self.keys(user)
+            try:
+                await self.scripts['revoke'](keys=[session_prefix + jti, index], args=[jti])
+            except RedisError as err:
+                raise self._unavailable(err)
+        if user.refresh_token == token:
+            await repository_users.update_token(user, None, db)
+
+    async def revoke_all(self, user: User, db: AsyncSession) -> None:
+        """
+        The revoke_all function ends every session of the user, logging out everywhere.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user
+        :param db: AsyncSession: Pass the database session to the function
+        :return: None
+        """
+        if user.refresh_token is not None:
+            await repository_users.update_token(user, None, db)
+        if self.uses_redis:
+            session_prefix, index = self.keys(user)
+            try:
+                await self.scripts['revoke_all'](keys=[index], args=[session_prefix])
+            except RedisError as err:
+                raise self._unavailable(err)
+
+
+refresh_sessions = RefreshSessions(settings.refresh_token_ttl, settings.refresh_session_max_per_user,
+                                   settings.refresh_session_store)
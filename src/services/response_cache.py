@@ -0,0 +1,105 @@
+import logging
+from typing import Any
+
+import orjson
+from fastapi import Response
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Redis cache of rendered JSON responses of the contact read endpoints, keyed by user, endpoint and parameters.
+    Each user has a generation counter that is part of every key; a write to the user's contacts increments it,
+    so all the user's entries become unreachable at once and expire on their own.
+    Without a Redis client every lookup misses and nothing is stored.
+    """
+    prefix = 'response_cache'
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.redis: Redis | None = None
+
+    def start(self, redis: Redis) -> None:
+        self.redis = redis
+
+    def stop(self) -> None:
+        self.redis = None
+
+    def _generation_key(self, user_id: int) -> str:
+        return f'{self.prefix}:{user_id}:generation'
+
+    async def lookup(self, user_id: int, name: str, *params) -> tuple[str | None, Response | None]:
+        """
+        The lookup function looks for a cached response of the endpoint name called with params.
+        The generation is read before the caller queries the database, so a write that happens meanwhile
+        moves readers to a new generation and the result stored under the old key is never served.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the data
+        :param name: str: Name of the endpoint
+        :param params: The parameters that select the response
+        :return: The key to store the response under (None when caching is off) and the cached response or None
+        """
+        if self.redis is None:
+            return None, None
+        try:
+            generation = await self.redis.get(self._generation_key(user_id)) or 0
+            key = f'{self.prefix}:{user_id}:{generation}:{name}:'.encode() + orjson.dumps(params)
+            value = await self.redis.get(key)
+        except RedisError as err:
+            logger.warning("response cache lookup failed: %s", err)
+            return None, None
+        if value is None:
+            return key.decode(), None
+        if isinstance(value, str):
+            value = value.encode()
+        headers, _, body = value.partition(b'\n')
+        return key.decode(), self.render(body, orjson.loads(headers))
+
+    async def store(self, key: str | None, content: Any, headers: dict | None = None) -> Response:
+        """
+        The store function serializes content with orjson, caches it under the key from lookup
+        together with the headers, and returns the response to send.
+
+        :param self: Represent the instance of the class
+        :param key: str | None: The key returned by lookup
+        :param content: Any: JSON-serializable response content
+        :param headers: dict | None: Response headers to cache with the body
+        :return: The rendered response
+        """
+        headers = headers or {}
+        body = orjson.dumps(content)
+        if key is not None:
+            try:
+                await self.redis.set(key, orjson.dumps(headers) + b'\n' + body, ex=self.ttl)
+            except RedisError as err:
+                logger.warning("response cache store failed: %s", err)
+        return self.render(body, headers)
+
+    async def bump(self, user_id: int) -> None:
+        """
+        The bump function invalidates every cached response of the user by incrementing the generation.
+        Call it after the write is committed.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The user whose contacts changed
+        :return: None
+        """
+        if self.redis is None:
+            return
+        try:
+            await self.redis.incr(self._generation_key(user_id))
+        except RedisError as err:
+            logger.warning("response cache generation of user %s was not bumped: %s", user_id, err)
+
+    @staticmethod
+    def render(body: bytes, headers: dict) -> Response:
+        return Response(content=body, media_type='application/json', headers=headers)
+
+
+response_cache = ResponseCache(ttl=settings.response_cache_ttl)
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.conf.config import settings
+from src.services.metrics import current_route
+
+logger = logging.getLogger(__name__)
+
+REPOSITORY_PACKAGE = 'src.repository.'
+MAX_PARAMETER_LENGTH = 200
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: time, level, logger and the fields passed in extra={'data': ...}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage(), **getattr(record, 'data', {})}
+        return json.dumps(entry, default=str)
+
+
+def _caller_frames():
+    # async drivers run the statement in a greenlet; the coroutines that awaited it are on the parent's stack
+    current, frame = greenlet.getcurrent(), sys._getframe(1)
+    while True:
+        while frame is not None:
+            yield frame
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return
+        frame = current.gr_frame
+
+
+def repository_function() -> str | None:
+    """
+    The repository_function function finds the repository function that is executing the current statement.
+
+    :return: The dotted name of the function, or None outside the repositories
+    """
+    for frame in _caller_frames():
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith(REPOSITORY_PACKAGE):
+            return f'{module}.{frame.f_code.co_name}'
+    return None
+
+
+def _format_parameters(parameters):
+    if not settings.slow_query_log_parameters:
+        return None
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f'<{len(parameters)} parameter sets>'
+    return [repr(value)[:MAX_PARAMETER_LENGTH] for value in
+            (parameters.values() if isinstance(parameters, dict) else parameters or ())]
+
+
+class SlowQueryLog:
+    """
+    Logs every statement slower than slow_query_threshold seconds as a structured JSON record with its
+    parameters, the calling repository function and the route. Records go through a queue to a listener
+    thread, so the request never waits on the log stream. On Postgres a share of the slow SELECTs
+    (slow_query_explain_rate) is run again with EXPLAIN (ANALYZE, BUFFERS) in the background, one at a time.
+    """
+
+    def __init__(self, threshold: float, explain_rate: float):
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self._listener: QueueListener | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._explaining = False
+
+    def instrument(self, engine) -> None:
+        """
+        The instrument function times the statements of the engine.
+
+        :param self: Represent the instance of the class
+        :param engine: Engine | AsyncEngine: The engine to watch
+        :return: None
+        """
+        sync_engine = getattr(engine, 'sync_engine', engine)
+
+        @event.listens_for(sync_engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._slow_query_start = time.perf_counter()
+
+        @event.listens_for(sync_engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            duration = time.perf_counter() - context._slow_query_start
+            if duration >= self.threshold and not context.execution_options.get('slow_query_explain'):
+                self.record(engine, statement, parameters, executemany, duration)
+
+    def record(self, engine, statement: str, parameters, executemany: bool, duration: float) -> None:
+        logger.warning('slow query', extra={'data': {
+            'event': 'slow_query',
+            'duration_ms': round(duration * 1000, 3),
+            'statement': statement,
+            'parameters': _format_parameters(parameters),
+            'executemany': executemany,
+            'function': repository_function(),
+            'route': current_route.get(),
+        }})
+        if self._should_explain(engine, statement, executemany):
+            self._explaining = True
+            asyncio.run_coroutine_threadsafe(self.explain(engine, statement, parameters), self._loop)
+
+    def _should_explain(self, engine, statement: str, executemany: bool) -> bool:
+        return (self._loop is not None and not self._explaining and not executemany
+                and isinstance(engine, AsyncEngine) and engine.dialect.name == 'postgresql'
+                and statement.lstrip()[:6].upper() == 'SELECT' and random.random() < self.explain_rate)
+
+    async def explain(self, engine: AsyncEngine, statement: str, parameters) -> None:
+        """
+        The explain function runs the statement again under EXPLAIN (ANALYZE, BUFFERS) and logs the plan.
+        The transaction is rolled back.
+
+        :param self: Represent the instance of the class
+        :param engine: AsyncEngine: The engine that ran the statement
+        :param statement: str: The statement as sent to the driver
+        :param parameters: The driver parameters of the statement
+        :return: None
+        """
+        try:
+            async with engine.connect() as connection:
+                result = await connection.exec_driver_sql(
+                    f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}', parameters,
+                    execution_options={'slow_query_explain': True}
+                )
+                plan = result.scalar()
+            logger.warning('slow query plan', extra={'data': {'event': 'slow_query_plan', 'statement': statement,
+                                                              'plan': plan}})
+        except SQLAlchemyError as err:
+            logger.warning('slow query plan failed: %s', err)
+        finally:
+            self._explaining = False
+
+    def start(self, stream=None) -> None:
+        """
+        The start function sends the slow query records through a queue to a JSON stream (stderr by default)
+        and enables EXPLAIN capture on the running event loop.
+
+        :param self: Represent the instance of the class
+        :param stream: The stream to write to
+        :return: None
+        """
+        self._loop = asyncio.get_running_loop()
+        records = queue.SimpleQueue()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        self._listener = QueueListener(records, handler)
+        self._listener.start()
+        logger.addHandler(QueueHandler(records))
+        logger.propagate = False
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        for handler in [handler for handler in logger.handlers if isinstance(handler, QueueHandler)]:
+            logger.removeHandler(handler)
+        logger.propagate = True
+        self._loop = None
+
+
+slow_query_log = SlowQueryLog(threshold=settings.slow_query_threshold, explain_rate=settings.slow_query_explain_rate)
@@ -0,0 +1,124 @@
+import asyncio
+from abc import ABC, abstractmethod
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+import cloudinary
+
+from src.conf.config import settings
+from src.services.cloud_image import CloudImage
+from src.services.images import make_avatars
+
+
+class AvatarStorage(ABC):
+    """
+    Where the avatar images are kept. store_avatar renders the fixed WebP sizes locally and saves every size,
+    so the backend only stores small files and never transforms them. Backends implement save and build_url.
+    """
+
+    def __init__(self, sizes: tuple[int, ...] = (250, 128, 64), quality: int = 80):
+        self.sizes = tuple(sizes)
+        self.quality = quality
+
+    @abstractmethod
+    def save(self, key: str, size: int, data: bytes) -> str:
+        """
+        The save function stores one rendered size of the avatar. It blocks, it runs on the upload threads.
+
+        :param self: Represent the instance of the class
+        :param key: str: The name of the avatar
+        :param size: int: The size in pixels
+        :param data: bytes: The WebP image
+        :return: The version of the stored image, part of its URL so a new avatar is not served from caches
+        """
+
+    @abstractmethod
+    def build_url(self, key: str, size: int, version: str) -> str:
+        """
+        The build_url function returns the URL of one stored size of the avatar.
+
+        :param self: Represent the instance of the class
+        :param key: str: The name of the avatar
+        :param size: int: The size in pixels
+        :param version: str: The version returned by save
+        :return: The URL of the image
+        """
+
+    def _store(self, file: BinaryIO, key: str) -> dict[int, str]:
+        avatars = make_avatars(file, self.sizes, self.quality)
+        return {size: self.build_url(key, size, self.save(key, size, data)) for size, data in avatars.items()}
+
+    async def store_avatar(self, file: BinaryIO, key: str) -> dict[int, str]:
+        """
+        The store_avatar function decodes the uploaded image, renders every size and saves them,
+        all on the upload threads, so neither the CPU work nor the storage I/O stalls the event loop.
+
+        :param self: Represent the instance of the class
+        :param file: BinaryIO: The uploaded image
+        :param key: str: The name of the avatar
+        :return: The URL of every size
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(upload_executor, self._store, file, key)
+
+
+class LocalStorage(AvatarStorage):
+    """
+    Keeps the avatars as files under root, served by the app under base_url (see main.py).
+    The version is a hash of the content.
+    """
+
+    def __init__(self, root: str | Path, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+
+    def save(self, key: str, size: int, data: bytes) -> str:
+        path = self.root / f'{key}-{size}.webp'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write aside and rename, so a reader never sees a half written file
+        handle, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return hashlib.sha1(data).hexdigest()[:12]
+
+    def build_url(self, key: str, size: int, version: str) -> str:
+        return f'{self.base_url}/{key}-{size}.webp?v={version}'
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Uploads the rendered sizes to Cloudinary as separate images and serves them as they are, without transformations.
+    The version is the one Cloudinary assigns to the upload.
+    """
+
+    def save(self, key: str, size: int, data: bytes) -> str:
+        r = CloudImage.upload(data, f'{key}-{size}')
+        return str(r.get('version'))
+
+    def build_url(self, key: str, size: int, version: str) -> str:
+        return cloudinary.CloudinaryImage(f'{key}-{size}').build_url(format='webp', version=version)
+
+
+upload_executor = ThreadPoolExecutor(max_workers=settings.cloudinary_upload_workers, thread_name_prefix='avatar-upload')
+
+
+def get_avatar_storage() -> AvatarStorage:
+    options = {'sizes': tuple(settings.avatar_sizes), 'quality': settings.avatar_webp_quality}
+    if settings.avatar_storage == 'local':
+        return LocalStorage(settings.storage_local_root, settings.storage_local_url, **options)
+    if settings.avatar_storage == 'cloudinary':
+        return CloudinaryStorage(**options)
+    raise ValueError(f"Unknown avatar storage '{settings.avatar_storage}'")
+
+
+avatar_storage = get_avatar_storage()
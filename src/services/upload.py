@@ -0,0 +1,70 @@
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator
+
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import Headers, UploadFile
+from starlette.formparsers import MultiPartParser
+
+from src.conf.config import settings
+
+
+async def limit_stream(stream: AsyncIterator[bytes], max_size: int) -> AsyncIterator[bytes]:
+    """
+    The limit_stream function passes the chunks of stream through and refuses the request with HTTP 413
+    as soon as more than max_size bytes have arrived, without reading the rest.
+
+    :param stream: AsyncIterator[bytes]: The request body
+    :param max_size: int: The largest accepted number of bytes
+    :return: The chunks of the stream
+    """
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > max_size:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"File is larger than {max_size} bytes")
+        yield chunk
+
+
+async def spool_upload(request: Request, field: str = 'file', max_size: int = settings.avatar_max_size) -> UploadFile:
+    """
+    The spool_upload function reads an uploaded file from the request body chunk by chunk into a spooled
+    temporary file, which stays in memory up to avatar_spool_memory bytes and moves to disk beyond that.
+    The body is either multipart/form-data with the file in field, or the raw file with its own Content-Type.
+    A declared or actual size above max_size is refused with HTTP 413. The caller closes the returned file.
+
+    :param request: Request: The request to read
+    :param field: str: Name of the multipart field that holds the file
+    :param max_size: int: The largest accepted body in bytes
+    :return: The uploaded file, positioned at its start
+    """
+    content_length = request.headers.get('content-length')
+    # a multipart body carries a few hundred bytes of boundaries and part headers around the file
+    if content_length and content_length.isdigit() and int(content_length) > max_size + 16 * 1024:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"File is larger than {max_size} bytes")
+    stream = limit_stream(request.stream(), max_size)
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        parser = MultiPartParser(request.headers, stream, max_files=1, max_fields=10)
+        parser.max_file_size = settings.avatar_spool_memory
+        form = await parser.parse()
+        file = form.get(field)
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Field '{field}' is required")
+        await file.seek(0)
+        return file
+    if not content_type:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Content-Type is required")
+    spool = SpooledTemporaryFile(max_size=settings.avatar_spool_memory)
+    try:
+        async for chunk in stream:
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    if not spool.tell():
+        spool.close()
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Empty file")
+    spool.seek(0)
+    return UploadFile(file=spool, filename=field, headers=Headers({'content-type': content_type}))
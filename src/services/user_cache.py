@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Per-worker cache of the users resolved by Auth.get_current_user, keyed by the token subject.
+    Writes to a user call invalidate(), which drops the local entry and publishes the email
+    on a Redis channel so the other workers drop theirs too.
+    """
+    channel = 'user_cache:invalidate'
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)
+        self.redis: Redis | None = None
+        self._listener: asyncio.Task | None = None
+
+    def get(self, email: str) -> User | None:
+        return self.cache.get(email)
+
+    def set(self, email: str, user: User) -> None:
+        self.cache.set(email, user)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function removes the user from this worker's cache and
+        notifies the other workers through Redis pub/sub.
+
+        :param self: Represent the instance of the class
+        :param email: str: The token subject of the changed user
+        :return: None
+        """
+        self.cache.pop(email)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.publish(self.channel, email)
+        except RedisError as err:
+            logger.warning("user cache invalidation for %s was not published: %s", email, err)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function subscribes the cache to the invalidation channel.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The Redis client of the application
+        :return: None
+        """
+        self.redis = redis
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        self.redis = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.cache.pop(message["data"])
+            except RedisError as err:
+                # invalidations may have been missed while disconnected
+                logger.warning("user cache subscription lost: %s", err)
+                self.cache.clear()
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+user_cache = UserCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
@@ -1,11 +1,17 @@
+from contextlib import contextmanager
+from unittest.mock import patch
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
-from src.database.models import Base
+from src.database.models import Base, User
 from src.database.db_connect import get_db
+from src.services.metrics import instrument_engine
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -15,6 +21,11 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient runs every request on a fresh event loop, so async connections must not be pooled
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_engine)
+instrument_engine(async_engine)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -34,11 +45,12 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
+    async def override_get_db():
+        db = TestingAsyncSessionLocal()
         try:
-            yield session
+            yield db
         finally:
-            session.close()
+            await db.close()
 
     app.dependency_overrides[get_db] = override_get_db
 
@@ -48,3 +60,41 @@ def client(session):
 @pytest.fixture(scope="module")
 def user():
     return {"username": "deadpool", "email": "deadpool@example.com", "password": "12345678"}
+
+
+@pytest.fixture(scope="module")
+def token(client, user, session):
+    with patch("src.routes.auth.send_email"):
+        client.post("/api/auth/signup", json=user)
+    current_user: User = session.query(User).filter(User.email == user.get("email")).first()
+    current_user.confirmed = True
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": user.get("email"), "password": user.get("password")})
+    return response.json()["access_token"]
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Counts the SQL statements the application runs and checks them against a budget:
+
+        with query_budget(2):
+            client.get("/api/contacts/", headers=...)
+    """
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    @contextmanager
+    def budget(limit: int):
+        start = len(statements)
+        yield statements
+        used = statements[start:]
+        assert len(used) <= limit, f"{len(used)} queries, budget is {limit}:\n" + "\n".join(used)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        yield budget
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
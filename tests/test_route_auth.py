@@ -1,15 +1,19 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
-from src.database.models import User
+from fastapi.testclient import TestClient
 
+from src.database.models import EmailOutbox, User
 
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+
+def test_create_user(client, user, session):
     response = client.post("/api/auth/signup", json=user)
     assert response.status_code == 201, response.text
     payload = response.json()
     assert payload["email"] == user.get('email')
+    message = session.query(EmailOutbox).filter(EmailOutbox.recipient == user.get('email')).one()
+    assert message.status == "pending"
+    assert message.subject == "Confirm your email"
+    assert user.get('username') in message.body
 
 
 def test_repeat_create_user(client, user, monkeypatch):
@@ -21,6 +25,14 @@ def test_repeat_create_user(client, user, monkeypatch):
     assert payload["detail"] == "Account already exists"
 
 
+def test_create_user_is_rolled_back_without_email(client, session, monkeypatch):
+    monkeypatch.setattr("src.routes.auth.send_email", AsyncMock(side_effect=RuntimeError("template error")))
+    response = TestClient(client.app, raise_server_exceptions=False).post(
+        "/api/auth/signup", json={"username": "nomail", "email": "nomail@example.com", "password": "12345678"})
+    assert response.status_code == 500
+    assert session.query(User).filter(User.email == "nomail@example.com").first() is None
+
+
 def test_login_user_not_confirmed_email(client, user):
     response = client.post("/api/auth/login", data={"username": user.get("email"), "password": user.get("password")})
     assert response.status_code == 401, response.text
@@ -56,3 +68,36 @@ def test_login_user_with_wrong_email(client, user, session):
     assert response.status_code == 401, response.text
     payload = response.json()
     assert payload["detail"] == "Invalid email"
+
+
+def test_refresh_token_rotation(client, user, session):
+    response = client.post("/api/auth/login", data={"username": user.get("email"), "password": user.get("password")})
+    token = response.json()["refresh_token"]
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    new_token = response.json()["refresh_token"]
+    assert new_token != token
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401, response.text
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {new_token}"})
+    assert response.status_code == 401, response.text
+
+
+def test_logout(client, user, session):
+    response = client.post("/api/auth/login", data={"username": user.get("email"), "password": user.get("password")})
+    token = response.json()["refresh_token"]
+    response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 204, response.text
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401, response.text
+
+
+def test_logout_all(client, user, session):
+    response = client.post("/api/auth/login", data={"username": user.get("email"), "password": user.get("password")})
+    tokens = response.json()
+    response = client.post("/api/auth/logout_all", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 204, response.text
+    session.expire_all()
+    assert session.query(User).filter(User.email == user.get("email")).one().refresh_token is None
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401, response.text
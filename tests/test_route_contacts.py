@@ -0,0 +1,245 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from src.database.models import Contact, User
+
+
+@pytest.fixture(scope="module")
+def user_id(session, user, token):
+    return session.query(User).filter(User.email == user.get("email")).first().id
+
+
+@pytest.fixture(scope="module")
+def contacts(session, user_id):
+    stranger = User(username='stranger', email='stranger@example.com', password='12345678')
+    session.add(stranger)
+    session.flush()
+    contacts = [Contact(first_name=f'John{i}', last_name='Doe', email=f'john{i}@doe.com', phone='0661234567',
+                        birthday=date(1988, 2, 1), user_id=user_id if i % 3 else stranger.id) for i in range(7)]
+    session.add_all(contacts)
+    session.commit()
+    return [contact.id for contact in contacts if contact.user_id == user_id]
+
+
+def test_read_contacts_offset(client, token, contacts):
+    response = client.get("/api/contacts/", params={"limit": 2, "offset": 2},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert [contact["id"] for contact in response.json()] == contacts[2:4]
+
+
+def test_read_contacts_cursor(client, token, contacts):
+    url, ids = "/api/contacts/?limit=2", []
+    while url:
+        response = client.get(url, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        ids += [contact["id"] for contact in response.json()]
+        url = response.links.get("next", {}).get("url")
+    assert ids == contacts
+
+
+def test_read_contacts_invalid_cursor(client, token):
+    response = client.get("/api/contacts/", params={"after": "garbage"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_search_contacts(client, token, contacts):
+    response = client.get("/api/contacts/search", params={"query": "john4"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert [contact["id"] for contact in response.json()] == [contacts[2]]
+    response = client.get("/api/contacts/search", params={"query": "john3"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == []
+
+
+def test_search_contacts_paginated(client, token, contacts):
+    response = client.get("/api/contacts/search", params={"query": "do", "limit": 2, "offset": 1},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert [contact["id"] for contact in response.json()] == contacts[1:3]
+
+
+def test_get_contacts_birthday(client, token, session, user_id):
+    today = date.today()
+    soon, later = today + timedelta(days=3), today + timedelta(days=20)
+    session.add_all([
+        Contact(first_name='Soon', last_name='Smith', email='soon@smith.com', phone='0661234567',
+                birthday=date(2000, soon.month, soon.day), user_id=user_id),
+        Contact(first_name='Later', last_name='Smith', email='later@smith.com', phone='0661234567',
+                birthday=date(2000, later.month, later.day), user_id=user_id),
+    ])
+    session.commit()
+    response = client.get("/api/contacts/birthday/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert [contact["first_name"] for contact in response.json() if contact["last_name"] == 'Smith'] == ['Soon']
+    response = client.get("/api/contacts/birthday/", params={"days": 30}, headers={"Authorization": f"Bearer {token}"})
+    assert [contact["first_name"] for contact in response.json()
+            if contact["last_name"] == 'Smith'] == ['Soon', 'Later']
+
+
+def test_get_contact_etag(client, token, contacts):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(f"/api/contacts/{contacts[0]}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["cache-control"] == "private, no-cache"
+    etag = response.headers["etag"]
+    response = client.get(f"/api/contacts/{contacts[0]}", headers={**headers, "If-None-Match": f'W/{etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_read_contacts_etag(client, token, contacts):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/", params={"limit": 2}, headers=headers)
+    etag = response.headers["etag"]
+    response = client.get("/api/contacts/", params={"limit": 2}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get("/api/contacts/", params={"limit": 3}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    response = client.post("/api/contacts/batch", headers=headers, json={"operations": [{"op": "create", "contact": {
+        "first_name": "Gil", "last_name": "Etag", "email": "gil@etag.com", "phone": "1", "birthday": "1990-01-01"}}]})
+    contact_id = response.json()["results"][0]["id"]
+    response = client.get("/api/contacts/", params={"limit": 2}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    contact = client.get(f"/api/contacts/{contact_id}", headers=headers).json()
+    response = client.put(f"/api/contacts/{contact_id}", headers=headers, json={**contact, "phone": "2"})
+    assert response.status_code == 200, response.text
+    response = client.get("/api/contacts/", params={"limit": 2}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    client.delete(f"/api/contacts/{contact_id}", headers=headers)
+
+
+def test_get_contact_of_another_user(client, token, contacts):
+    response = client.get(f"/api/contacts/{contacts[0] - 1}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
+
+
+def test_import_contacts_csv(client, token):
+    body = ('first_name,last_name,email,phone,birthday,other_info\n'
+            'Ann,Import,ann@import.com,0661234567,1990-01-02,"multi\nline"\n'
+            'Bad,Import,not-an-email,0661234567,1990-01-02,\n'
+            'Bob,Import,bob@import.com,0661234567,1991-03-04,\n')
+    response = client.post("/api/contacts/import", content=body,
+                           headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv"})
+    assert response.status_code == 201, response.text
+    payload = response.json()
+    assert payload["imported"] == 2
+    assert payload["failed"] == 1
+    assert payload["errors"][0]["row"] == 2
+    assert payload["errors"][0]["errors"][0].startswith("email")
+    response = client.get("/api/contacts/search", params={"query": "Import"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert [(c["first_name"], c["other_info"]) for c in response.json()] == [("Ann", "multi\nline"), ("Bob", None)]
+
+
+def test_import_contacts_ndjson(client, token):
+    body = ('{"first_name": "Cid", "last_name": "Ndjson", "email": "cid@nd.com", "phone": "1", "birthday": "1990-01-02"}\n'
+            '{broken\n')
+    response = client.post("/api/contacts/import", params={"format": "ndjson"}, content=body,
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    assert response.json()["imported"] == 1
+    assert response.json()["errors"][0]["row"] == 2
+
+
+def test_import_contacts_vcard(client, token):
+    body = ('BEGIN:VCARD\r\nVERSION:3.0\r\nN:Vcard;Dee;;;\r\nFN:Dee Vcard\r\nEMAIL;TYPE=home:dee@vc\r\n .com\r\n'
+            'TEL:0661234567\r\nBDAY:19900102\r\nNOTE:first\\, second\r\nEND:VCARD\r\n')
+    response = client.post("/api/contacts/import", content=body,
+                           headers={"Authorization": f"Bearer {token}", "Content-Type": "text/vcard"})
+    assert response.status_code == 201, response.text
+    assert response.json() == {"imported": 1, "failed": 0, "errors": []}
+    response = client.get("/api/contacts/search", params={"query": "Vcard"},
+                          headers={"Authorization": f"Bearer {token}"})
+    contact = response.json()[0]
+    assert (contact["email"], contact["birthday"], contact["other_info"]) == ("dee@vc.com", "1990-01-02", "first, second")
+
+
+def test_import_contacts_unsupported(client, token):
+    response = client.post("/api/contacts/import", content="x", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 415, response.text
+
+
+def test_export_contacts_ndjson(client, token, contacts):
+    response = client.get("/api/contacts/export", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="contacts.ndjson"'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows][:len(contacts)] == contacts
+    assert rows[0]["birthday"] == "1988-02-01"
+
+
+def test_export_contacts_csv_gzip(client, token, contacts):
+    response = client.get("/api/contacts/export", params={"format": "csv", "gzip": True},
+                          headers={"Authorization": f"Bearer {token}", "Accept-Encoding": "identity"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-disposition"] == 'attachment; filename="contacts.csv.gz"'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert [int(row["id"]) for row in rows][:len(contacts)] == contacts
+    assert rows[0]["email"] == "john1@doe.com"
+
+
+def test_export_contacts_vcard(client, token, contacts):
+    response = client.get("/api/contacts/export", params={"format": "vcard"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.text.count("BEGIN:VCARD") >= len(contacts)
+    assert "N:Doe;John1;;;\r\n" in response.text
+
+
+def test_batch_contacts(client, token, contacts):
+    new_contact = {"first_name": "Eve", "last_name": "Batch", "email": "eve@batch.com", "phone": "1",
+                   "birthday": "1990-12-31"}
+    operations = [
+        {"op": "create", "contact": new_contact},
+        {"op": "update", "id": contacts[0], "contact": {**new_contact, "first_name": "Updated"}},
+        {"op": "delete", "id": contacts[1]},
+        {"op": "delete", "id": contacts[0]},
+        {"op": "delete", "id": contacts[0] - 1},
+        {"op": "create", "contact": {**new_contact, "first_name": "Fay"}},
+    ]
+    response = client.post("/api/contacts/batch", json={"operations": operations},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [201, 200, 204, 409, 404, 201]
+    assert results[5]["id"] == results[0]["id"] + 1
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get(f"/api/contacts/{results[0]['id']}", headers=headers).json()["first_name"] == "Eve"
+    assert client.get(f"/api/contacts/{contacts[0]}", headers=headers).json()["first_name"] == "Updated"
+    assert client.get(f"/api/contacts/{contacts[1]}", headers=headers).status_code == 404
+
+
+def test_batch_contacts_invalid(client, token):
+    response = client.post("/api/contacts/batch", json={"operations": [{"op": "update", "id": 1}]},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+
+
+def test_update_contact(client, token, contacts):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact = client.get(f"/api/contacts/{contacts[0]}", headers=headers).json()
+    body = {**contact, "phone": "0509999999", "other_info": "updated"}
+    response = client.put(f"/api/contacts/{contacts[0]}", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    payload = response.json()
+    assert (payload["phone"], payload["other_info"]) == ("0509999999", "updated")
+    assert payload["updated_at"] is not None
+    assert client.get(f"/api/contacts/{contacts[0]}", headers=headers).json()["other_info"] == "updated"
+
+
+def test_update_contact_of_another_user(client, token, contacts):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact = client.get(f"/api/contacts/{contacts[0]}", headers=headers).json()
+    response = client.put(f"/api/contacts/{contacts[0] - 1}", json=contact, headers=headers)
+    assert response.status_code == 404, response.text
@@ -0,0 +1,31 @@
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def get_samples(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/plain")
+    return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(response.text) for sample in family.samples}
+
+
+def test_metrics(client, token):
+    labels = (("method", "GET"), ("route", "/api/contacts/{contact_id}"), ("status", "404"))
+    before = get_samples(client)
+    response = client.get("/api/contacts/100500", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
+    assert float(response.headers["performance"]) > 0
+    samples = get_samples(client)
+    assert samples[("http_requests_total", labels)] - before.get(("http_requests_total", labels), 0) == 1
+    assert samples[("http_request_duration_seconds_count", labels)] >= 1
+    route = (("route", "/api/contacts/{contact_id}"),)
+    assert samples[("http_request_db_queries_sum", route)] >= 1
+    assert samples[("db_queries_total", ())] >= samples[("http_request_db_queries_sum", route)]
+    assert samples[("http_requests_in_progress", (("method", "GET"), ("route", "/metrics")))] == 1
+    assert ("password_pool_workers", ()) in samples
+
+
+def test_metrics_unmatched_route(client):
+    client.get("/no/such/path")
+    samples = get_samples(client)
+    assert samples[("http_requests_total", (("method", "GET"), ("route", "<unmatched>"), ("status", "404")))] >= 1
@@ -0,0 +1,67 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.services.auth import auth_service
+
+CONTACT = {"first_name": "Budget", "last_name": "Doe", "email": "budget@doe.com", "phone": "1", "birthday": "1990-01-01"}
+
+
+@pytest.fixture(scope="module")
+def headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="module")
+def contact_ids(client, headers):
+    response = client.post("/api/contacts/batch", headers=headers,
+                           json={"operations": [{"op": "create", "contact": CONTACT} for _ in range(3)]})
+    # the first request of the module also loads the current user into the user cache
+    return [result["id"] for result in response.json()["results"]]
+
+
+def test_confirmed_email_budget(client, query_budget):
+    user = {"username": "budgeter", "email": "budgeter@example.com", "password": "12345678"}
+    with patch("src.routes.auth.send_email"):
+        client.post("/api/auth/signup", json=user)
+    token = auth_service.create_email_token({"sub": user["email"]})
+    with query_budget(2):
+        response = client.get(f"/api/auth/confirmed_email/{token}")
+    assert response.json() == {"message": "Email confirmed"}
+
+
+@pytest.mark.parametrize("url, params, budget", [
+    ("/api/contacts/", {}, 2),
+    ("/api/contacts/search", {"query": "Budget"}, 1),
+    ("/api/contacts/birthday/", {}, 1),
+])
+def test_read_budget(client, headers, contact_ids, query_budget, url, params, budget):
+    with query_budget(budget):
+        response = client.get(url, params=params, headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_get_contact_budget(client, headers, contact_ids, query_budget):
+    with query_budget(1):
+        response = client.get(f"/api/contacts/{contact_ids[0]}", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_batch_budget(client, headers, contact_ids, query_budget):
+    operations = [{"op": "create", "contact": CONTACT}, {"op": "create", "contact": CONTACT},
+                  {"op": "update", "id": contact_ids[0], "contact": CONTACT},
+                  {"op": "update", "id": contact_ids[1], "contact": CONTACT},
+                  {"op": "delete", "id": contact_ids[2]}]
+    # one SELECT of the ids, one UPDATE, one DELETE and the increment of the contacts version;
+    # Postgres sends the creates as one INSERT ... RETURNING, SQLite cannot keep RETURNING in parameter order
+    # for a multi-row INSERT and sends one per contact
+    with query_budget(4 + 2):
+        response = client.post("/api/contacts/batch", headers=headers, json={"operations": operations})
+    assert [result["status"] for result in response.json()["results"]] == [201, 201, 200, 200, 204]
+
+
+def test_import_budget(client, headers, query_budget):
+    body = "first_name,last_name,email,phone,birthday\n" + "Imp,Doe,imp@doe.com,1,1990-01-01\n" * 50
+    with query_budget(2):
+        response = client.post("/api/contacts/import", content=body, headers={**headers, "Content-Type": "text/csv"})
+    assert response.json()["imported"] == 50
@@ -0,0 +1,34 @@
+import pytest
+
+from src.services.rate_limit import rate_limits
+
+CONTACT = {"id": 999, "first_name": "Rate", "last_name": "Limited", "email": "rate@limited.com",
+           "phone": "0661234567", "birthday": "1990-01-01", "other_info": None, "created_at": "2024-01-01",
+           "updated_at": "2024-01-01"}
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    rate_limits.clear()
+    yield
+    rate_limits.clear()
+
+
+def test_root_rate_limit(client):
+    assert client.get("/").status_code == 200
+    assert client.get("/").status_code == 200
+    response = client.get("/")
+    assert response.status_code == 429, response.text
+    assert 0 < int(response.headers["retry-after"]) <= 5
+
+
+def test_create_contact_rate_limit_per_user(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    for number in range(2):
+        response = client.post("/api/contacts/", json={**CONTACT, "id": 1000 + number}, headers=headers)
+        assert response.status_code == 200, response.text
+    response = client.post("/api/contacts/", json=CONTACT, headers=headers)
+    assert response.status_code == 429, response.text
+    # the limit is the user's, anonymous clients from the same address have their own
+    response = client.post("/api/contacts/", json=CONTACT)
+    assert response.status_code == 401, response.text
@@ -0,0 +1,115 @@
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+from src.conf.config import settings
+from src.services.storage import LocalStorage
+from tests.conftest import TestingAsyncSessionLocal
+
+
+def make_png(width=640, height=480) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+PNG = make_png()
+
+
+class RecordingStorage(LocalStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = []
+
+    def save(self, key, size, data):
+        self.threads.append(threading.current_thread().name)
+        return super().save(key, size, data)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = RecordingStorage(tmp_path, "/media", sizes=(250, 128, 64))
+    monkeypatch.setattr("src.routes.users.avatar_storage", storage)
+    return storage
+
+
+def test_read_users_me_etag(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/users/me/", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("/api/users/me/", headers={**headers, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+
+def test_update_avatar_multipart(client, token, storage):
+    response = client.patch("/api/users/avatar", files={"file": ("avatar.png", PNG, "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    avatar = response.json()["avatar"]
+    assert avatar.startswith("/media/web9/") and "-250.webp?v=" in avatar
+    files = sorted(storage.root.glob("web9/*.webp"))
+    assert [file.name.rsplit("-", 1)[1] for file in files] == ["128.webp", "250.webp", "64.webp"]
+    for file in files:
+        with Image.open(file) as image:
+            assert image.format == "WEBP"
+            assert image.size[0] == image.size[1] == int(file.stem.rsplit("-", 1)[1])
+    # off the event loop, on the upload threads
+    assert storage.threads[0].startswith("avatar-upload")
+
+
+def test_update_avatar_raw_body(client, token, storage):
+    response = client.patch("/api/users/avatar", content=PNG,
+                            headers={"Authorization": f"Bearer {token}", "Content-Type": "image/png"})
+    assert response.status_code == 200, response.text
+    assert len(storage.threads) == 3
+
+
+def test_update_avatar_not_an_image(client, token, storage):
+    response = client.patch("/api/users/avatar", files={"file": ("avatar.png", b"not an image", "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+    assert storage.threads == []
+
+
+def test_update_avatar_too_large(client, token, storage):
+    body = b"\x00" * (settings.avatar_max_size + 1)
+    response = client.patch("/api/users/avatar", files={"file": ("avatar.png", body, "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 413, response.text
+
+    def chunks():
+        for _ in range(settings.avatar_max_size // 65536 + 2):
+            yield b"\x00" * 65536
+
+    # no Content-Length: the limit applies while streaming
+    response = client.patch("/api/users/avatar", content=chunks(),
+                            headers={"Authorization": f"Bearer {token}", "Content-Type": "image/png"})
+    assert response.status_code == 413, response.text
+    assert storage.threads == []
+
+
+def test_update_avatar_missing_file(client, token, storage):
+    response = client.patch("/api/users/avatar", data={"other": "value"}, files={"image": ("a.png", PNG)},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+
+
+def test_update_avatar_background(client, token, storage, monkeypatch):
+    monkeypatch.setattr("src.routes.users.get_session", TestingAsyncSessionLocal)
+    response = client.patch("/api/users/avatar", params={"background": "true"},
+                            files={"file": ("avatar.png", PNG, "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 202, response.text
+    job = response.json()
+    assert job["status"] == "pending"
+    assert response.headers["location"].endswith(f"/api/users/avatar/jobs/{job['id']}")
+
+    response = client.get(response.headers["location"], headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "done"
+    assert "-250.webp?v=" in response.json()["avatar"]
+
+    response = client.get("/api/users/avatar/jobs/unknown", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
@@ -0,0 +1,37 @@
+import sqlite3
+import unittest
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from src.database.pool import InstrumentedQueuePool, pool_stats
+
+
+class TestInstrumentedPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = InstrumentedQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=1,
+                                          timeout=0.01)
+
+    def tearDown(self):
+        self.pool.dispose()
+
+    def test_checkout_stats(self):
+        checkouts, timeouts = pool_stats.checkouts, pool_stats.timeouts
+        first = self.pool.connect()
+        second = self.pool.connect()
+        stats = pool_stats.snapshot(self.pool)
+        self.assertEqual(stats["checked_out"], 2)
+        self.assertEqual(stats["overflow"], 1)
+        with self.assertRaises(PoolTimeoutError):
+            self.pool.connect()
+        first.close()
+        second.close()
+        stats = pool_stats.snapshot(self.pool)
+        self.assertEqual(stats["checkouts"] - checkouts, 2)
+        self.assertEqual(stats["timeouts"] - timeouts, 1)
+        self.assertGreaterEqual(stats["wait_seconds_max"], 0.01)
+        self.assertEqual(stats["checked_out"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import random
+import tempfile
+import unittest
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, User
+from src.database.seed import fake_contacts, seed, split_contacts
+
+
+class TestSeedData(unittest.TestCase):
+
+    def test_same_seed_same_rows(self):
+        first = list(fake_contacts(random.Random(7), 0, 1, 50))
+        second = list(fake_contacts(random.Random(7), 0, 1, 50))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, list(fake_contacts(random.Random(8), 0, 1, 50)))
+
+    def test_split_contacts(self):
+        counts = split_contacts(random.Random(1), 1000, 30)
+        self.assertEqual(len(counts), 30)
+        self.assertEqual(sum(counts), 1000)
+
+
+class TestSeed(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.engine = create_async_engine(f'sqlite+aiosqlite:///{self.path}', poolclass=NullPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        os.unlink(self.path)
+
+    async def test_seed(self):
+        async with AsyncSession(self.engine, expire_on_commit=False) as db:
+            result = await seed(db, 5, 120, seed_value=3, chunk_size=50)
+            self.assertEqual(result, (5, 120))
+            self.assertEqual(await db.scalar(select(func.count(User.id))), 5)
+            self.assertEqual(await db.scalar(select(func.count(Contact.id))), 120)
+            self.assertEqual(await db.scalar(select(func.count(User.id)).filter(User.confirmed.is_(True))), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
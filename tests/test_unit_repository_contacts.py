@@ -1,10 +1,13 @@
+import asyncio
 import unittest
-from unittest.mock import MagicMock
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User, Contact
-from src.schemas import ContactResponse, BirthdayResponse
+from src.schemas import ContactResponse
 from src.repository.contacts import (
     create_contact,
     get_contacts,
@@ -12,13 +15,14 @@ from src.repository.contacts import (
     update_contact,
     remove_contact,
     search_contacts,
-    get_birthdays_one_week)
+    get_birthdays_one_week,
+    copy_contacts_csv)
 
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
         self.user = User(id=1)
         self.fake_user = Contact(
             id=1, first_name='John', last_name='Doe', birthday='1988-02-01',
@@ -34,7 +38,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         body = ContactResponse(id=1, first_name='John', last_name='Doe', birthday='1988-02-01',
                                email='john@doe.com', phone='0661234567', other_info='test',
                                created_at='2021-02-01', updated_at='2021-02-01')
-        result = await create_contact(body=body, db=self.session)
+        result = await create_contact(body=body, user=self.user, db=self.session)
         self.assertEqual(result.id, body.id)
         self.assertEqual(result.first_name, body.first_name)
         self.assertEqual(result.last_name, body.last_name)
@@ -42,62 +46,82 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.email, body.email)
         self.assertEqual(result.phone, body.phone)
         self.assertEqual(result.other_info, body.other_info)
+        self.assertEqual(result.user_id, self.user.id)
         self.assertTrue(hasattr(result, 'id'))
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().limit().offset().all.return_value = contacts
-        result = await get_contacts(limit=10, offset=0, db=self.session)
+        self.session.execute.return_value = MagicMock(**{'all.return_value': contacts})
+        result = await get_contacts(limit=10, offset=0, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contact_found(self):
         contact = Contact()
-        self.session.query().filter_by().first.return_value = contact
-        result = await get_contact_by_id(contact_id=contact.id, db=self.session)
+        self.session.scalar.return_value = contact
+        result = await get_contact_by_id(contact_id=contact.id, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter_by().first.return_value = None
-        result = await get_contact_by_id(contact_id=0, db=self.session)
+        self.session.scalar.return_value = None
+        result = await get_contact_by_id(contact_id=0, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_update_contact(self):
         body = Contact(id=1, first_name='John', last_name='Doe', birthday='1988-02-01',
                        email='john@doe.com', phone='0661234567', other_info='test')
-        self.session.query().filter_by().first.return_value = body
-        result = await update_contact(body=body, contact_id=1, db=self.session)
+        self.session.scalar.return_value = body
+        result = await update_contact(body=body, contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, body)
 
     async def test_update_contact_not_found(self):
         body = Contact(id=1, first_name='John', last_name='Doe', birthday='1988-02-01',
                        email='john@doe.com', phone='0661234567', other_info='test')
-        self.session.query().filter_by().first.return_value = None
-        result = await update_contact(body=body, contact_id=1, db=self.session)
+        self.session.scalar.return_value = None
+        result = await update_contact(body=body, contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_remove_contact(self):
         body = Contact()
-        self.session.query().filter_by().first.return_value = body
-        result = await remove_contact(contact_id=1, db=self.session)
+        self.session.scalar.return_value = body
+        result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, body)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter_by().first.return_value = None
-        result = await remove_contact(contact_id=1, db=self.session)
+        self.session.scalar.return_value = None
+        result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_search_contacts(self):
         body = [Contact(), Contact()]
-        self.session.query().filter().all.return_value = body
-        result = await search_contacts(query="1", db=self.session)
+        self.session.execute.return_value = MagicMock(**{'all.return_value': body})
+        result = await search_contacts(query="1", limit=10, offset=0, user=self.user, db=self.session)
         self.assertEqual(result, body)
 
     async def test_get_birthdays_one_week(self):
-        contacts = [Contact(id=1, first_name='John', last_name='Doe', birthday='1988-05-01')]
-        contacts_birthday = [BirthdayResponse(id=1, first_name='John', last_name='Doe', birthday='1988-05-01')]
-        self.session.query().filter().all.return_value = contacts
-        result = await get_birthdays_one_week(db=self.session)
-        self.assertEqual(contacts_birthday, result)
+        contacts = [(1, 'John', 'Doe', date(1988, 5, 1))]
+        self.session.execute.return_value = MagicMock(**{'all.return_value': contacts})
+        result = await get_birthdays_one_week(user=self.user, db=self.session)
+        self.assertEqual(contacts, result)
+
+    async def test_copy_contacts_csv_stops_copy_when_client_leaves(self):
+        copying = asyncio.Event()
+
+        async def copy_from_query(query, output, **kwargs):
+            copying.set()
+            while True:
+                await output(b'row\n')
+
+        connection = MagicMock(dialect=postgresql.dialect())
+        connection.get_raw_connection = AsyncMock(return_value=MagicMock(driver_connection=MagicMock(
+            copy_from_query=copy_from_query)))
+        self.session.connection = AsyncMock(return_value=connection)
+        chunks = copy_contacts_csv(self.user, self.session)
+        self.assertEqual(await chunks.__anext__(), b'row\n')
+        await copying.wait()
+        # the producer now waits on the full queue
+        await asyncio.sleep(0)
+        await asyncio.wait_for(chunks.aclose(), 1)
+        self.assertEqual(len(asyncio.all_tasks()), 1)
 
 
 if __name__ == "__main__":
@@ -2,7 +2,7 @@ import unittest
 from unittest.mock import MagicMock
 
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User, Contact
 from src.schemas import UserModel
@@ -18,7 +18,7 @@ from src.repository.users import (
 class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
         self.test_user = User(
             id=1,
             username='SuperUser',
@@ -30,7 +30,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_user_by_email(self):
         user = self.test_user
-        self.session.query().filter_by().first.return_value = user
+        self.session.scalar.return_value = user
         result = await get_user_by_email(email=self.test_user.email, db=self.session)
         self.assertEqual(result, user)
 
@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import patch
+
+from jose import jwt
+
+from src.services.auth import Auth
+
+
+class TestAuthTokenCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.token_cache.clear()
+        self.auth.invalid_token_cache.clear()
+
+    async def test_decode_token_cached(self):
+        token = await self.auth.create_access_token(data={"sub": "user@super.com"})
+        with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as mock_decode:
+            first = self.auth.decode_token(token)
+            second = self.auth.decode_token(token)
+        self.assertEqual(first["sub"], "user@super.com")
+        self.assertEqual(first, second)
+        mock_decode.assert_called_once()
+
+    async def test_decode_token_expires_with_token(self):
+        token = await self.auth.create_access_token(data={"sub": "user@super.com"}, expires_delta=60)
+        with patch("src.services.auth.TTLCache.set") as mock_set:
+            self.auth.decode_token(token)
+        ttl = mock_set.call_args.kwargs["ttl"]
+        self.assertTrue(0 < ttl <= 60)
+
+    def test_decode_token_invalid_cached(self):
+        with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as mock_decode:
+            self.assertIsNone(self.auth.decode_token("not-a-token"))
+            self.assertIsNone(self.auth.decode_token("not-a-token"))
+        mock_decode.assert_called_once()
+        self.assertEqual(len(self.auth.token_cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.database.models import User
+from src.services.cache import TTLCache
+from src.services.response_cache import ResponseCache
+from src.services.user_cache import UserCache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache(maxsize=2, ttl=60)
+
+    def test_get_hit_and_miss(self):
+        self.cache.set("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_expired(self):
+        with patch("src.services.cache.time.monotonic", return_value=1000):
+            self.cache.set("a", 1, ttl=5)
+        with patch("src.services.cache.time.monotonic", return_value=1005):
+            self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = UserCache(maxsize=10, ttl=60)
+        self.user = User(id=1, email="user@super.com")
+
+    async def test_invalidate_local(self):
+        self.cache.set(self.user.email, self.user)
+        await self.cache.invalidate(self.user.email)
+        self.assertIsNone(self.cache.get(self.user.email))
+
+    async def test_invalidate_publish(self):
+        self.cache.redis = AsyncMock()
+        self.cache.set(self.user.email, self.user)
+        await self.cache.invalidate(self.user.email)
+        self.cache.redis.publish.assert_awaited_once_with(UserCache.channel, self.user.email)
+        self.assertIsNone(self.cache.get(self.user.email))
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key.decode() if isinstance(key, bytes) else key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value.decode()
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(ttl=60)
+
+    async def test_disabled(self):
+        key, cached = await self.cache.lookup(1, "contacts", 10, 0)
+        self.assertIsNone(key)
+        self.assertIsNone(cached)
+        response = await self.cache.store(key, [{"id": 1}])
+        self.assertEqual(response.body, b'[{"id":1}]')
+
+    async def test_hit_and_bump(self):
+        self.cache.start(FakeRedis())
+        key, cached = await self.cache.lookup(1, "contacts", 10, 0)
+        self.assertIsNone(cached)
+        await self.cache.store(key, [{"id": 1}], {"ETag": '"x"'})
+        _, cached = await self.cache.lookup(1, "contacts", 10, 0)
+        self.assertEqual(cached.body, b'[{"id":1}]')
+        self.assertEqual(cached.headers["etag"], '"x"')
+        _, other = await self.cache.lookup(2, "contacts", 10, 0)
+        self.assertIsNone(other)
+        await self.cache.bump(1)
+        _, cached = await self.cache.lookup(1, "contacts", 10, 0)
+        self.assertIsNone(cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
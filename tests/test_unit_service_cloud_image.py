@@ -0,0 +1,31 @@
+import inspect
+import unittest
+from unittest.mock import patch
+
+import cloudinary
+import cloudinary.uploader
+
+from src.conf.config import settings
+from src.services.cloud_image import POOLED_UPLOADER_VERSIONS, size_upload_pool
+
+
+class TestUploadPool(unittest.TestCase):
+
+    def test_sdk_still_uploads_through_module_pool(self):
+        # fails when an SDK upgrade moves the pool that size_upload_pool replaces
+        self.assertTrue(cloudinary.VERSION.startswith(POOLED_UPLOADER_VERSIONS), cloudinary.VERSION)
+        self.assertTrue(hasattr(cloudinary.uploader, "_http"))
+        self.assertIn("_http.request(", inspect.getsource(cloudinary.uploader.call_api))
+
+    def test_pool_sized_to_upload_workers(self):
+        self.assertEqual(cloudinary.uploader._http.connection_pool_kw["maxsize"], settings.cloudinary_upload_workers)
+
+    def test_unchecked_version_keeps_default_pool(self):
+        pool = cloudinary.uploader._http
+        with patch("cloudinary.VERSION", "2.0.0"), self.assertLogs("src.services.cloud_image", "WARNING"):
+            self.assertFalse(size_upload_pool(32))
+        self.assertIs(cloudinary.uploader._http, pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+from aiosmtpd.controller import Controller
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, EmailOutbox
+from src.repository.email_outbox import enqueue_email
+from src.services.email_outbox import EmailOutboxWorker
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Handler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("rejected"):
+            return "550 mailbox unavailable"
+        if address.startswith("busy"):
+            return "451 try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.sessions.add(id(session))
+        return "250 Message accepted for delivery"
+
+
+class TestEmailOutboxWorker(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}", poolclass=NullPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.sessions = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.handler = Handler()
+        self.port = free_port()
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+        self.controller.start()
+        self.worker = EmailOutboxWorker(self.sessions, {"hostname": "127.0.0.1", "port": self.port, "timeout": 5},
+                                        batch_size=10, concurrency=2, max_attempts=3, backoff=60)
+
+    async def asyncTearDown(self):
+        await self.worker.stop()
+        if self.controller.server is not None:
+            self.controller.stop()
+        await self.engine.dispose()
+        os.unlink(self.path)
+
+    async def enqueue(self, *recipients):
+        async with self.sessions() as db:
+            for recipient in recipients:
+                await enqueue_email(recipient, "Confirm your email", f"<p>Hello {recipient}</p>", db)
+            await db.commit()
+
+    async def outbox(self) -> dict:
+        async with self.sessions() as db:
+            return {message.recipient: message for message in await db.scalars(select(EmailOutbox))}
+
+    async def test_drain_reuses_connections(self):
+        await self.enqueue(*(f"user{number}@example.com" for number in range(5)))
+        self.assertEqual(await self.worker.drain(), 5)
+        await self.enqueue("late@example.com")
+        self.assertEqual(await self.worker.drain(), 1)
+        self.assertEqual(await self.worker.drain(), 0)
+        self.assertEqual(len(self.handler.messages), 6)
+        self.assertLessEqual(len(self.handler.sessions), 2)
+        messages = await self.outbox()
+        self.assertEqual({message.status for message in messages.values()}, {"sent"})
+        self.assertEqual({message.attempts for message in messages.values()}, {1})
+        self.assertIn("Hello late@example.com", self.handler.messages[-1].content.decode())
+
+    async def test_drain_failures(self):
+        await self.enqueue("ok@example.com", "rejected@example.com", "busy@example.com")
+        self.assertEqual(await self.worker.drain(), 3)
+        messages = await self.outbox()
+        self.assertEqual(messages["ok@example.com"].status, "sent")
+        self.assertEqual(messages["rejected@example.com"].status, "failed")
+        self.assertTrue(messages["rejected@example.com"].last_error.startswith("550"))
+        busy = messages["busy@example.com"]
+        self.assertEqual((busy.status, busy.attempts), ("pending", 1))
+        self.assertGreater(busy.next_attempt_at, datetime.utcnow())
+        # not due yet
+        self.assertEqual(await self.worker.drain(), 0)
+
+    async def test_server_down(self):
+        self.controller.stop()
+        await self.enqueue("down1@example.com", "down2@example.com", "down3@example.com")
+        self.assertEqual(await self.worker.drain(), 3)
+        messages = await self.outbox()
+        self.assertEqual({message.status for message in messages.values()}, {"pending"})
+        # each connection fails once, the message left over is not counted as an attempt
+        self.assertEqual(sorted(message.attempts for message in messages.values()), [0, 1, 1])
+        self.assertTrue(all(message.next_attempt_at > datetime.utcnow() for message in messages.values()))
+
+    async def test_gives_up_after_max_attempts(self):
+        await self.enqueue("busy@example.com")
+        async with self.sessions() as db:
+            message = await db.scalar(select(EmailOutbox))
+            message.attempts = 2
+            await db.commit()
+        await self.worker.drain()
+        message = (await self.outbox())["busy@example.com"]
+        self.assertEqual((message.status, message.attempts), ("failed", 3))
+
+    async def test_worker_survives_unexpected_errors(self):
+        self.worker.poll_interval = 0.01
+        self.worker.drain = AsyncMock(side_effect=[RuntimeError("bug"), RuntimeError("bug"), 0, 0])
+        self.worker.start()
+        for _ in range(100):
+            if self.worker.drain.await_count == 4:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.worker.drain.await_count, 4)
+        self.assertFalse(self.worker._task.done())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import threading
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.password_pool import PasswordHashPool
+
+
+class TestPasswordHashPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pool = PasswordHashPool(max_workers=1, max_queue=1, timeout=1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+
+    async def test_run(self):
+        result = await self.pool.run(sum, [1, 2, 3])
+        self.assertEqual(result, 6)
+        self.assertEqual(self.pool.stats()["completed"], 1)
+
+    async def test_run_queue_full(self):
+        self.pool.queued = self.pool.max_queue
+        with self.assertRaises(HTTPException) as err:
+            await self.pool.run(sum, [1])
+        self.assertEqual(err.exception.status_code, 503)
+        self.assertEqual(self.pool.stats()["rejected"], 1)
+
+    async def test_run_timeout(self):
+        self.pool.timeout = 0.05
+        with self.assertRaises(HTTPException) as err:
+            await self.pool.run(self.release.wait)
+        self.assertEqual(err.exception.status_code, 503)
+        stats = self.pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["active"], 1)
+        self.assertEqual(stats["saturation"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import fakeredis
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from src.services.rate_limit import RateLimits
+
+
+class CountingRedis(fakeredis.FakeAsyncRedis):
+    calls = 0
+
+    async def evalsha(self, *args):
+        self.calls += 1
+        return await super().evalsha(*args)
+
+
+class TestRateLimits(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = CountingRedis(decode_responses=True)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    def worker(self, **kwargs) -> RateLimits:
+        limits = RateLimits(**kwargs)
+        limits.start(self.redis)
+        return limits
+
+    async def test_workers_share_the_limit_in_batches(self):
+        first, second = self.worker(), self.worker()
+        results = await asyncio.gather(*(limits.acquire("user:a", 100, 60)
+                                         for limits in (first, second) for _ in range(80)))
+        self.assertEqual(sum(result == 0 for result in results), 100)
+        self.assertLessEqual(self.redis.calls, 15)
+        self.assertTrue(all(0 < result <= 60 for result in results if result))
+
+    async def test_refusal_is_remembered_locally(self):
+        limits = self.worker()
+        self.assertEqual(await limits.acquire("user:a", 2, 10), 0)
+        self.assertEqual(await limits.acquire("user:a", 2, 10), 0)
+        calls = self.redis.calls
+        for _ in range(5):
+            self.assertGreater(await limits.acquire("user:a", 2, 10), 0)
+        self.assertEqual(self.redis.calls, calls + 1)
+        self.assertEqual(await limits.acquire("user:b", 2, 10), 0)
+
+    async def test_script_reloaded_after_flush(self):
+        limits = self.worker()
+        self.assertEqual(await limits.acquire("user:a", 5, 10), 0)
+        await self.redis.script_flush()
+        limits.clear()
+        self.assertEqual(await limits.acquire("user:a", 5, 10), 0)
+
+    async def test_local_bucket_without_redis(self):
+        limits = RateLimits()
+        with patch("src.services.rate_limit.time.monotonic", return_value=1000.0):
+            self.assertEqual(limits.acquire_local("user:a", 2, 10), 0)
+            self.assertEqual(limits.acquire_local("user:a", 2, 10), 0)
+            self.assertAlmostEqual(limits.acquire_local("user:a", 2, 10), 5.0)
+        with patch("src.services.rate_limit.time.monotonic", return_value=1005.0):
+            self.assertEqual(limits.acquire_local("user:a", 2, 10), 0)
+
+    async def test_redis_down(self):
+        broken = Redis(port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0))
+        limits = RateLimits(fail_open=True, retry_interval=60)
+        limits.start(broken)
+        self.assertEqual(await limits.acquire("user:a", 1, 10), 0)
+        # Redis is not asked again during the retry interval
+        with patch.object(broken, "evalsha") as evalsha:
+            self.assertGreater(await limits.acquire("user:a", 1, 10), 0)
+        evalsha.assert_not_called()
+
+        limits = RateLimits(fail_open=False)
+        limits.start(broken)
+        with self.assertRaises(HTTPException) as error:
+            await limits.acquire("user:a", 1, 10)
+        self.assertEqual(error.exception.status_code, 503)
+        await broken.aclose()
+
+if __name__ == "__main__":
+    unittest.main()
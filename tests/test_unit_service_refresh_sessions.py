@@ -0,0 +1,82 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import fakeredis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.services.auth import auth_service
+from src.services.refresh_sessions import RefreshSessions
+
+
+class TestRefreshSessions(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.sessions = RefreshSessions(ttl=3600, max_sessions=3)
+        self.sessions.start(self.redis)
+        self.user = SimpleNamespace(id=1, email="user@example.com", refresh_token=None)
+        self.db = AsyncMock()
+        patcher = patch("src.services.refresh_sessions.repository_users.update_token", new_callable=AsyncMock)
+        self.update_token = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def login(self) -> tuple[str, dict]:
+        token = await self.sessions.create(self.user, self.db)
+        return token, await auth_service.decode_refresh_claims(token)
+
+    async def active(self) -> set[str]:
+        return set(await self.redis.zrange(self.sessions.keys(self.user)[1], 0, -1))
+
+    async def test_session_per_device_expires_with_token(self):
+        _, phone = await self.login()
+        _, laptop = await self.login()
+        self.assertEqual(await self.active(), {phone['jti'], laptop['jti']})
+        key = self.sessions.keys(self.user)[0] + phone['jti']
+        self.assertTrue(0 < await self.redis.pttl(key) <= 3600 * 1000)
+        self.update_token.assert_not_awaited()
+
+    async def test_rotate_and_reuse_ends_all_sessions(self):
+        token, claims = await self.login()
+        await self.login()
+        new_token = await self.sessions.rotate(self.user, token, claims, self.db)
+        new_claims = await auth_service.decode_refresh_claims(new_token)
+        self.assertNotIn(claims['jti'], await self.active())
+        self.assertIn(new_claims['jti'], await self.active())
+        with self.assertRaises(HTTPException) as err:
+            await self.sessions.rotate(self.user, token, claims, self.db)
+        self.assertEqual(err.exception.status_code, 401)
+        self.assertEqual(await self.active(), set())
+
+    async def test_revoke_one_device(self):
+        token, phone = await self.login()
+        _, laptop = await self.login()
+        await self.sessions.revoke(self.user, token, phone, self.db)
+        self.assertEqual(await self.active(), {laptop['jti']})
+        self.assertFalse(await self.redis.exists(self.sessions.keys(self.user)[0] + phone['jti']))
+
+    async def test_oldest_sessions_evicted(self):
+        first = [await self.login() for _ in range(4)]
+        self.assertEqual(await self.active(), {claims['jti'] for _, claims in first[1:]})
+        with self.assertRaises(HTTPException):
+            await self.sessions.rotate(self.user, *first[0], self.db)
+
+    async def test_database_session_moves_to_redis(self):
+        self.sessions.stop()
+        token, claims = await self.login()
+        self.update_token.assert_awaited_with(self.user, token, self.db)
+        self.user.refresh_token = token
+        self.sessions.start(self.redis)
+        new_token = await self.sessions.rotate(self.user, token, claims, self.db)
+        self.update_token.assert_awaited_with(self.user, None, self.db)
+        new_claims = await auth_service.decode_refresh_claims(new_token)
+        self.assertEqual(await self.active(), {new_claims['jti']})
+
+    async def test_login_falls_back_to_database(self):
+        self.sessions.scripts['add'] = AsyncMock(side_effect=ConnectionError("down"))
+        token, _ = await self.login()
+        self.update_token.assert_awaited_once_with(self.user, token, self.db)
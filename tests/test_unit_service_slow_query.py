@@ -0,0 +1,46 @@
+import io
+import json
+import unittest
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, User
+from src.repository.contacts import get_contacts
+from src.services.slow_query import SlowQueryLog, logger
+
+
+class TestSlowQueryLog(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=NullPool)
+        self.slow_query_log = SlowQueryLog(threshold=0, explain_rate=1)
+        self.slow_query_log.instrument(self.engine)
+
+    async def asyncTearDown(self):
+        self.slow_query_log.stop()
+        await self.engine.dispose()
+
+    async def test_repository_function(self):
+        async with AsyncSession(self.engine) as session:
+            await session.run_sync(lambda sync_session: Base.metadata.create_all(sync_session.connection()))
+            with self.assertLogs(logger) as logs:
+                await get_contacts(limit=10, offset=0, user=User(id=1), db=session)
+        data = logs.records[-1].data
+        self.assertEqual(data["event"], "slow_query")
+        self.assertEqual(data["function"], "src.repository.contacts.get_contacts")
+        self.assertIn("FROM contacts", data["statement"])
+        self.assertEqual(data["parameters"][0], "1")
+
+    async def test_json_stream(self):
+        stream = io.StringIO()
+        self.slow_query_log.start(stream)
+        async with self.engine.connect() as connection:
+            await connection.exec_driver_sql("SELECT 1")
+        self.slow_query_log.stop()
+        entry = json.loads(stream.getvalue().splitlines()[0])
+        self.assertEqual((entry["event"], entry["statement"], entry["function"]), ("slow_query", "SELECT 1", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
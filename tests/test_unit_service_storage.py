@@ -0,0 +1,65 @@
+import io
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from src.services.images import InvalidImage, make_avatars
+from src.services.storage import AvatarStorage, CloudinaryStorage, LocalStorage
+
+
+def make_jpeg(width: int, height: int) -> io.BytesIO:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (10, 120, 200)).save(buffer, "JPEG")
+    buffer.seek(0)
+    return buffer
+
+
+class TestMakeAvatars(unittest.TestCase):
+
+    def test_sizes(self):
+        avatars = make_avatars(make_jpeg(1600, 900), (250, 64))
+        self.assertEqual(set(avatars), {250, 64})
+        for size, data in avatars.items():
+            with Image.open(io.BytesIO(data)) as image:
+                self.assertEqual(image.format, "WEBP")
+                self.assertEqual(image.size, (size, size))
+        self.assertLess(len(avatars[250]), 10000)
+
+    def test_transparency_kept(self):
+        buffer = io.BytesIO()
+        Image.new("RGBA", (300, 300), (0, 0, 0, 0)).save(buffer, "PNG")
+        with Image.open(io.BytesIO(make_avatars(buffer, (64,))[64])) as image:
+            self.assertEqual(image.mode, "RGBA")
+
+    def test_invalid(self):
+        with self.assertRaises(InvalidImage):
+            make_avatars(io.BytesIO(b"GIF89a broken"), (64,))
+
+
+class TestStorage(unittest.TestCase):
+
+    def test_local_url(self):
+        storage = LocalStorage("/tmp/unused", "/media/")
+        self.assertEqual(storage.build_url("web9/abc", 64, "123"), "/media/web9/abc-64.webp?v=123")
+
+    def test_cloudinary_uploads_rendered_sizes(self):
+        storage = CloudinaryStorage(sizes=(250, 64))
+        with patch("src.services.storage.CloudImage.upload", return_value={"version": 42}) as upload:
+            urls = storage._store(make_jpeg(800, 800), "web9/abc")
+        self.assertEqual([call.args[1] for call in upload.call_args_list], ["web9/abc-250", "web9/abc-64"])
+        self.assertTrue(all(isinstance(call.args[0], bytes) for call in upload.call_args_list))
+        self.assertTrue(urls[250].endswith("/v42/web9/abc-250.webp"))
+        self.assertNotIn("c_fill", urls[64])
+
+    def test_incomplete_backend_fails_on_construction(self):
+        class NoUrls(AvatarStorage):
+            def save(self, key, size, data):
+                return "1"
+
+        with self.assertRaises(TypeError):
+            NoUrls()
+
+
+if __name__ == "__main__":
+    unittest.main()